@@ -0,0 +1,203 @@
+import csv
+import os
+
+import numpy as np
+
+
+
+# +===========================================================================+
+# |                            RunningStats class                             |
+# +===========================================================================+
+
+class RunningStats:
+    """Mean, variance, minimum and maximum of a stream of values, in constant memory (Welford)."""
+
+    def __init__(self):
+        """RunningStats class constructor."""
+
+        self.count = 0
+        self.mean = 0.0
+        self.M2 = 0.0 # Sum of squared differences from the mean
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, value):
+        """Adds a value to the statistics.
+
+        Args:
+            value (float): new value.
+        """
+
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta/self.count
+        self.M2 += delta*(value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    @property
+    def variance(self):
+        """float: population variance of the values (0 if there are less than two)."""
+        return self.M2/self.count if self.count > 1 else 0.0
+
+    @property
+    def std(self):
+        """float: population standard deviation of the values."""
+        return np.sqrt(self.variance)
+
+    @property
+    def rms(self):
+        """float: root mean square of the values."""
+        return np.sqrt(self.variance + self.mean**2)
+
+
+
+# +===========================================================================+
+# |                        TrajectoryAnalytics class                          |
+# +===========================================================================+
+
+class TrajectoryAnalytics:
+    """Run metrics computed in a single pass over the simulation steps, in constant memory."""
+
+    def __init__(self, start_position, lap_radius=20, saturation=1.0):
+        """TrajectoryAnalytics class constructor.
+
+        A lap is completed each time the robot comes back within lap_radius of its start
+        position after having gone further than twice that distance.
+
+        The motors are commanded max_motor_speed +/- pid and never clamped, so the control
+        effort is measured on the correction itself: a step is saturated when |pid| is at
+        least saturation times the maximum motor speed. With the default of 1, that is when
+        the inner wheel is commanded to stop or turn backwards.
+
+        Args:
+            start_position (tuple): robot initial position (x, y, heading).
+            lap_radius (float, optional): distance to the start that closes a lap, in the \
+                unit of the robot positions. Defaults to 20.
+            saturation (float, optional): |pid| threshold of a saturated step, as a fraction \
+                of the maximum motor speed. Defaults to 1.0.
+        """
+
+        self.start_x, self.start_y = start_position[0], start_position[1]
+        self.lap_radius = lap_radius
+        self.saturation = saturation
+
+        self.steps = 0
+        self.time = 0.0
+        self.path_length = 0.0
+        self.last_x, self.last_y = self.start_x, self.start_y
+
+        # Laps
+        self.left_start = False
+        self.lap_start_time = 0.0
+        self.lap_times = RunningStats()
+
+        # Controller error (sensor estimate of the cross-track error) and control effort
+        self.error = RunningStats()
+        self.pid = RunningStats()
+        self.saturated_steps = 0
+
+        # Oscillation: sign changes of the control signal
+        self.last_pid_sign = 0
+        self.pid_sign_changes = 0
+
+        # Sensor transitions (0 <-> 1)
+        self.last_readings = None
+        self.sensor_transitions = None
+
+    def update(self, dt, x, y, readings, error, pid, max_motor_speed):
+        """Adds one simulation step to the metrics.
+
+        Args:
+            dt (float): step duration, in seconds.
+            x, y (float): robot position after the step.
+            readings (np.ndarray): sensor readings used in the step.
+            error (float): controller error of the step.
+            pid (float): control value of the step, in rpm.
+            max_motor_speed (float): maximum motor speed, in rpm.
+        """
+
+        self.steps += 1
+        self.time += dt
+
+        # Path length
+        self.path_length += np.hypot(x - self.last_x, y - self.last_y)
+        self.last_x, self.last_y = x, y
+
+        # Laps
+        distance_to_start = np.hypot(x - self.start_x, y - self.start_y)
+        if distance_to_start > 2*self.lap_radius:
+            self.left_start = True
+        elif self.left_start and distance_to_start < self.lap_radius:
+            self.lap_times.update(self.time - self.lap_start_time)
+            self.lap_start_time = self.time
+            self.left_start = False
+
+        # Error and control effort
+        self.error.update(error)
+        self.pid.update(abs(pid))
+        if abs(pid) >= self.saturation*max_motor_speed:
+            self.saturated_steps += 1
+
+        # Oscillation
+        pid_sign = int(np.sign(pid))
+        if pid_sign != 0:
+            if self.last_pid_sign != 0 and pid_sign != self.last_pid_sign:
+                self.pid_sign_changes += 1
+            self.last_pid_sign = pid_sign
+
+        # Sensor transitions
+        readings = np.asarray(readings)
+        if self.last_readings is None:
+            self.sensor_transitions = np.zeros(len(readings), dtype=int)
+        else:
+            self.sensor_transitions += readings != self.last_readings
+        self.last_readings = readings.copy()
+
+    def row(self):
+        """Returns the metrics as a row of a results table.
+
+        Returns:
+            dict: metric name -> value.
+        """
+
+        time = self.time if self.time > 0 else np.nan
+
+        row = {
+            'steps': self.steps,
+            'time': self.time,
+            'path_length': self.path_length,
+            'laps': self.lap_times.count,
+            'best_lap_time': self.lap_times.min if self.lap_times.count else np.nan,
+            'mean_lap_time': self.lap_times.mean if self.lap_times.count else np.nan,
+            'error_mean': self.error.mean,
+            'error_std': self.error.std,
+            'error_rms': self.error.rms,
+            'error_max': max(abs(self.error.min), abs(self.error.max)) if self.error.count else np.nan,
+            'pid_mean': self.pid.mean,
+            'pid_max': self.pid.max if self.pid.count else np.nan,
+            'saturation': self.saturated_steps/self.steps if self.steps else np.nan,
+            'oscillation_frequency': self.pid_sign_changes/(2*time),
+        }
+
+        if self.sensor_transitions is not None:
+            for idx, transitions in enumerate(self.sensor_transitions):
+                row[f'sensor_{idx}_transition_rate'] = transitions/time
+
+        return row
+
+def write_row(path, row):
+    """Appends a row to a CSV results table, writing the header if the file is new.
+
+    Args:
+        path (str): CSV file path.
+        row (dict): column name -> value.
+    """
+
+    new_file = not os.path.isfile(path) or os.path.getsize(path) == 0
+
+    with open(path, 'a', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=list(row))
+        if new_file:
+            writer.writeheader()
+        writer.writerow(row)
@@ -0,0 +1,271 @@
+import numpy as np
+
+import tilemap
+import utils
+
+
+
+# +===========================================================================+
+# |                             SpatialHash class                             |
+# +===========================================================================+
+
+class SpatialHash:
+    """Uniform grid of square cells, each holding the objects whose center lies in it."""
+
+    # Half of the 3x3 neighbourhood, so that each pair of cells is visited once
+    NEIGHBOURS = [(1, -1), (1, 0), (1, 1), (0, 1)]
+
+    def __init__(self, cell_size):
+        """SpatialHash class constructor.
+
+        Args:
+            cell_size (float): cell side. Objects closer than this are always found \
+                as candidates.
+        """
+
+        self.cell_size = cell_size
+        self.cells = {}          # cell -> set of keys
+        self.cell_of = {}        # key -> cell
+
+    def cell(self, x, y):
+        """Returns the cell containing a position.
+
+        Args:
+            x, y (float): position.
+
+        Returns:
+            tuple: cell indices.
+        """
+
+        return (int(np.floor(x/self.cell_size)), int(np.floor(y/self.cell_size)))
+
+    def update(self, key, x, y):
+        """Inserts an object or moves it. Nothing changes if it stays in the same cell.
+
+        Args:
+            key (hashable): object identifier.
+            x, y (float): object position.
+        """
+
+        new_cell = self.cell(x, y)
+        old_cell = self.cell_of.get(key)
+
+        if old_cell == new_cell:
+            return
+        if old_cell is not None:
+            self.remove(key)
+
+        self.cells.setdefault(new_cell, set()).add(key)
+        self.cell_of[key] = new_cell
+
+    def remove(self, key):
+        """Removes an object.
+
+        Args:
+            key (hashable): object identifier.
+        """
+
+        cell = self.cell_of.pop(key)
+        self.cells[cell].discard(key)
+        if not self.cells[cell]:
+            del self.cells[cell]
+
+    def candidate_pairs(self):
+        """Returns the pairs of objects in the same or in neighbouring cells.
+
+        Returns:
+            list: pairs of keys (a, b), each pair listed once.
+        """
+
+        pairs = []
+
+        for (cell_x, cell_y), keys in self.cells.items():
+            keys = sorted(keys)
+
+            # Pairs inside the cell
+            for idx, a in enumerate(keys):
+                for b in keys[idx + 1:]:
+                    pairs.append((a, b))
+
+            # Pairs with the neighbouring cells
+            for dx, dy in self.NEIGHBOURS:
+                neighbours = self.cells.get((cell_x + dx, cell_y + dy))
+                if neighbours:
+                    for a in keys:
+                        for b in neighbours:
+                            pairs.append((a, b))
+
+        return pairs
+
+
+
+# +===========================================================================+
+# |                                Arena class                                |
+# +===========================================================================+
+
+class Arena:
+    """Many robots sharing a track, kept from overlapping each other. Does not need a window."""
+
+    def __init__(self, arena_map=None, meters_to_units=1.0):
+        """Arena class constructor.
+
+        Robots are treated as circles whose diameter is their width.
+
+        Args:
+            arena_map (np.ndarray, ArrayMap or TiledMap, optional): track read by the robot \
+                sensors (see tilemap.as_map). Without a map, robots keep their motor speeds. \
+                Defaults to None.
+            meters_to_units (float, optional): scale from Robot.width (meters) to the \
+                unit of the robot positions, e.g. the robot image width in pixels over \
+                Robot.width. Defaults to 1.0.
+        """
+
+        self.arena_map = None if arena_map is None else tilemap.as_map(arena_map)
+        self.meters_to_units = meters_to_units
+        self.robots = []
+        self.grid = None
+
+        # PID gains (kp, ki, kd), integral and last error of each robot (gains are None if not controlled)
+        self.gains = []
+        self.integrals = []
+        self.last_errors = []
+
+        # Pairs of robot indices that touched in the last step
+        self.collisions = []
+
+    def add_robot(self, robot, gains=(50, 3, 0.01)):
+        """Adds a robot to the arena.
+
+        If the arena has a map and the robot has at least four sensors, the robot follows \
+        the line with the PID control logic of main.py.
+
+        Args:
+            robot (Robot): robot to be added, with its sensors.
+            gains (tuple, optional): PID gains (kp, ki, kd). If None, the robot keeps its \
+                motor speeds. Defaults to (50, 3, 0.01).
+
+        Returns:
+            int: robot index in the arena.
+        """
+
+        self.robots.append(robot)
+        if self.arena_map is None or len(robot.sensors) < 4:
+            gains = None
+        self.gains.append(gains)
+        self.integrals.append(0)
+        self.last_errors.append(0)
+
+        diameter = robot.width*self.meters_to_units
+
+        # The cells must be at least as large as the largest robot
+        if self.grid is None or diameter > self.grid.cell_size:
+            self.grid = SpatialHash(diameter)
+            for idx, other in enumerate(self.robots):
+                self.grid.update(idx, other.x, other.y)
+        else:
+            self.grid.update(len(self.robots) - 1, robot.x, robot.y)
+
+        return len(self.robots) - 1
+
+    def step(self, dt):
+        """Runs the controllers, moves every robot and its sensors and separates the ones that overlap.
+
+        Args:
+            dt (float): time elapsed since the last iteration, in seconds.
+
+        Returns:
+            list: pairs of robot indices (a, b) that collided.
+        """
+
+        for idx, robot in enumerate(self.robots):
+            if self.gains[idx] is not None:
+                self.control(idx, dt)
+            robot.update_position(dt)
+            self.grid.update(idx, robot.x, robot.y)
+            self.update_sensors(idx)
+
+        self.collisions = self.resolve_collisions()
+
+        return self.collisions
+
+    def control(self, idx, dt):
+        """Reads the sensors of a robot and sets its motor speeds (same control logic as main.py).
+
+        Args:
+            idx (int): robot index.
+            dt (float): time elapsed since the last iteration, in seconds.
+        """
+
+        robot = self.robots[idx]
+        kp, ki, kd = self.gains[idx]
+
+        # Read the sensors (1 for light and 0 for dark)
+        for sensor in robot.sensors:
+            sensor.read_data(self.arena_map)
+
+        error = robot.sensors[1].data - robot.sensors[3].data
+        pid, self.integrals[idx] = utils.PID(kp=kp, ki=ki, kd=kd, I=self.integrals[idx],
+                                             error=error, last_error=self.last_errors[idx], dt=dt)
+        self.last_errors[idx] = error
+        robot.left_motor.set_speed(robot.left_motor.max_motor_speed + pid)
+        robot.right_motor.set_speed(robot.right_motor.max_motor_speed - pid)
+
+    def update_sensors(self, idx):
+        """Moves the sensors of a robot to its current position.
+
+        Args:
+            idx (int): robot index.
+        """
+
+        robot = self.robots[idx]
+        position = (robot.x, robot.y, robot.heading)
+
+        for sensor in robot.sensors:
+            sensor.update_position(sensor.relative_position, position)
+        for sensor in robot.line_scan_sensors:
+            sensor.update_position(position)
+
+    def resolve_collisions(self):
+        """Finds overlapping robots and pushes each pair apart along the line between their centers.
+
+        The sensors of the pushed robots are moved with them.
+
+        Returns:
+            list: pairs of robot indices (a, b) that were overlapping.
+        """
+
+        collisions = []
+
+        # Broad phase: only robots in neighbouring cells can touch
+        for a, b in self.grid.candidate_pairs():
+            robot_a = self.robots[a]
+            robot_b = self.robots[b]
+
+            # Narrow phase: distance between centers
+            dx = robot_b.x - robot_a.x
+            dy = robot_b.y - robot_a.y
+            distance = np.hypot(dx, dy)
+            min_distance = (robot_a.width + robot_b.width)*self.meters_to_units/2
+
+            if distance >= min_distance:
+                continue
+
+            collisions.append((min(a, b), max(a, b)))
+
+            # Coincident centers: separate them horizontally
+            if distance == 0:
+                dx, dy, distance = 1.0, 0.0, 1.0
+
+            # Each robot moves half of the overlap
+            push = (min_distance - distance)/2
+            robot_a.x -= dx/distance*push
+            robot_a.y -= dy/distance*push
+            robot_b.x += dx/distance*push
+            robot_b.y += dy/distance*push
+
+        # The pushed robots take their sensors with them
+        for idx in {idx for pair in collisions for idx in pair}:
+            self.grid.update(idx, self.robots[idx].x, self.robots[idx].y)
+            self.update_sensors(idx)
+
+        return sorted(collisions)
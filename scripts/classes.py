@@ -1,7 +1,10 @@
 import numpy as np
-import pygame
+import tilemap
 import utils
 
+# Imported on first use, only when something is rendered (see utils.LazyModule)
+pygame = utils.LazyModule(utils.import_pygame)
+
 
 
 # +===========================================================================+
@@ -43,6 +46,9 @@ class Sensor:
             robot_initial_position (tuple): robot initial position (x, y, heading), in meters and radians.
         """
         
+        # Position relative to the robot, kept to move the sensor with it (see Arena.step)
+        self.relative_position = sensor_relative_position
+        
         # Rotates the sensor position vector according to the robot's angle
         sensor_position_rotated = utils.rotate_vector(sensor_relative_position, robot_initial_position[2])
         
@@ -67,14 +73,86 @@ class Sensor:
         """Reads the sensor data. The sensor returns 0 if it reads a dark color and 1 if it reads a light color.
         
         Args:
-            map_image (pygame.Surface): arena image.
+            map_image (pygame.Surface, np.ndarray, ArrayMap or TiledMap): arena image, \
+                or any map (see tilemap.as_map), in which case the position is in the map's unit.
+        """
+        
+        if hasattr(map_image, 'get_at'):
+            # Sensor reads the color of the arena pixel at the sensor position
+            color = map_image.get_at((int(self.x), int(self.y)))[:-1]
+            
+            # Returns 1 if the color is lighter than medium gray and 0 otherwise.
+            self.data = 0 if utils.is_darker(color, (255/2, 255/2, 255/2)) else 1
+        else:
+            # Same threshold, on the grayscale intensity at the sensor position
+            intensity = tilemap.as_map(map_image).sample(self.x, self.y)
+            self.data = 0 if intensity < 255/2 else 1
+
+
+class LineScanSensor:
+    """Line-scan sensor (linear CCD or camera). Composes the Robot class.
+    
+    Samples evenly spaced points along a segment fixed to the robot, all of them
+    read at once from a grayscale array of the arena.
+    """
+    
+    def __init__(self, start_relative_position, end_relative_position, resolution,
+                 robot_initial_position, bilinear=False):
+        """LineScanSensor class constructor. Positions the strip relative to the robot's initial position.
+        
+        Args:
+            start_relative_position (tuple): first endpoint (x, y) of the strip relative to the robot, in meters.
+            end_relative_position (tuple): last endpoint (x, y) of the strip relative to the robot, in meters.
+            resolution (int): number of points sampled along the strip.
+            robot_initial_position (tuple): robot initial position (x, y, heading), in meters and radians.
+            bilinear (bool, optional): interpolates the map between pixels. Defaults to False.
+        """
+        
+        self.start_relative_position = start_relative_position
+        self.end_relative_position = end_relative_position
+        self.resolution = resolution
+        self.bilinear = bilinear
+        
+        # Positions of every point of the strip relative to the robot, shape (resolution, 2)
+        start = np.asarray(start_relative_position, dtype=float)
+        end = np.asarray(end_relative_position, dtype=float)
+        t = np.linspace(0, 1, resolution)[:, np.newaxis]
+        self.relative_positions = start + t*(end - start)
+        
+        self.update_position(robot_initial_position)
+        
+    def update_position(self, robot_position):
+        """Updates the position of every point of the strip according to the robot's position.
+        
+        Args:
+            robot_position (tuple): robot current position (x, y, heading), in meters and radians.
+        """
+        
+        # Rotates all the relative position vectors according to the robot's angle
+        positions_rotated = utils.rotate_vectors(self.relative_positions, robot_position[2])
+        
+        # Adds the relative position vectors to the robot's position
+        self.x = robot_position[0] + positions_rotated[:, 0]
+        self.y = robot_position[1] - positions_rotated[:, 1] # y-axis is inverted
+        
+    def read_data(self, map_array):
+        """Reads the sensor data. Each point returns 0 if it reads a dark color and 1 if it reads a light color.
+        
+        Args:
+            map_array (np.ndarray, ArrayMap or TiledMap): arena grayscale array (see Graphics.map_array) \
+                or any map (see tilemap.as_map), in which case the position is in the map's unit.
+            
+        Returns:
+            np.ndarray: readings of every point of the strip.
         """
         
-        # Sensor reads the color of the arena pixel at the sensor position
-        color = map_image.get_at((int(self.x), int(self.y)))[:-1]
+        # Grayscale intensity of every point of the strip in a single gather
+        self.intensity = tilemap.as_map(map_array).sample(self.x, self.y, self.bilinear)
+        
+        # 1 where the color is not darker than medium gray and 0 otherwise
+        self.data = (self.intensity >= 255/2).astype(int)
         
-        # Returns 1 if the color is lighter than medium gray and 0 otherwise.
-        self.data = 0 if utils.is_darker(color, (255/2, 255/2, 255/2)) else 1
+        return self.data
   
   
 class Robot:
@@ -97,6 +175,7 @@ class Robot:
         
         # List of the robot sensors
         self.sensors = []
+        self.line_scan_sensors = []
         
         # Scale factor from meters to pixels
         self.meters_to_pixels = 3779.52
@@ -176,6 +255,20 @@ class Robot:
         """
         self.sensors.append(Sensor(sensor_relative_position, robot_initial_position))
         
+    def add_line_scan_sensor(self, start_relative_position, end_relative_position, resolution,
+                             robot_initial_position, bilinear=False):
+        """Adds a line-scan sensor to the robot.
+        
+        Args:
+            start_relative_position (tuple): first endpoint (x, y) of the strip relative to the robot.
+            end_relative_position (tuple): last endpoint (x, y) of the strip relative to the robot.
+            resolution (int): number of points sampled along the strip.
+            robot_initial_position (tuple): robot initial position (x, y, heading).
+            bilinear (bool, optional): interpolates the map between pixels. Defaults to False.
+        """
+        self.line_scan_sensors.append(LineScanSensor(start_relative_position, end_relative_position,
+                                                     resolution, robot_initial_position, bilinear))
+        
         
 
 # +===========================================================================+
@@ -191,21 +284,64 @@ class Graphics:
         Args:
             screen_dimensions (tuple): window dimensions (width, height), in pixels.
             robot_image_path (str): robot image path.
-            map_imape_path (str): arena image path.
+            map_imape_path (str): arena image path. If None, the arena is a TiledMap \
+                drawn with draw_viewport.
         """
         
         pygame.init()
         
+        # Fonts are created on first use (see get_font)
+        self.fonts = {}
+        
+        # Robot images rotated to each whole degree, created on first use (see draw_robots)
+        self.rotated_robot_images = {}
+        
         # Loads the images and adjusts the map to the screen size
         self.robot_image = pygame.image.load(robot_image_path)
-        self.map_image = pygame.transform.scale(pygame.image.load(map_imape_path), screen_dimensions)
+        if map_imape_path is None:
+            self.map_image = None
+        else:
+            self.map_image = pygame.transform.scale(pygame.image.load(map_imape_path), screen_dimensions)
     
         # Creates the window 
         pygame.display.set_caption("Line Follower Simulator")
         self.map = pygame.display.set_mode(screen_dimensions)
     
-        # Draws the arena
-        self.map.blit(self.map_image, (0, 0))
+        if self.map_image is not None:
+            # Grayscale copy of the arena, read by line-scan sensors
+            self.map_array = utils.surface_to_grayscale(self.map_image)
+        
+            # Draws the arena
+            self.map.blit(self.map_image, (0, 0))
+    
+    def draw_viewport(self, tiled_map, center, meters_to_screen):
+        """Draws the part of a tiled map around a point, filling the window.
+        
+        Args:
+            tiled_map (TiledMap): arena.
+            center (tuple): world position (x, y) at the center of the window, in meters.
+            meters_to_screen (float): display scale, in screen pixels per meter.
+        """
+        
+        # Only the tiles under the window are read
+        gray = tiled_map.viewport(center, self.map.get_size(), meters_to_screen).astype(np.uint8)
+        pygame.surfarray.blit_array(self.map, np.repeat(gray[:, :, np.newaxis], 3, axis=2))
+        
+    def world_to_screen(self, x, y, center, meters_to_screen):
+        """Converts a world position into a window position for the viewport drawn by draw_viewport.
+        
+        Args:
+            x, y (float): world position, in meters.
+            center (tuple): world position (x, y) at the center of the window, in meters.
+            meters_to_screen (float): display scale, in screen pixels per meter.
+        
+        Returns:
+            tuple: window position (x, y), in pixels.
+        """
+        
+        width, height = self.map.get_size()
+        return (width/2 + (x - center[0])*meters_to_screen,
+                height/2 + (y - center[1])*meters_to_screen)
     
     def robot_positioning(self):
         """Positions the robot according to the user's mouse click.
@@ -415,6 +551,26 @@ class Graphics:
         # Draws the robot on the screen at the rectangle position
         self.map.blit(rotated_robot, rect)
         
+    def draw_robots(self, robots):
+        """Draws many robots on the screen in a single batched blit.
+        
+        Headings are rounded to whole degrees so that rotated images can be reused.
+        
+        Args:
+            robots (list): robots to be drawn.
+        """
+        
+        blits = []
+        for robot in robots:
+            angle = int(round(np.degrees(robot.heading))) % 360
+            if angle not in self.rotated_robot_images:
+                self.rotated_robot_images[angle] = pygame.transform.rotozoom(self.robot_image, angle, 1)
+            rotated_robot = self.rotated_robot_images[angle]
+            blits.append((rotated_robot, rotated_robot.get_rect(center=(robot.x, robot.y))))
+        
+        # Draws all the robots at once
+        self.map.blits(blits, doreturn=False)
+        
     def draw_sensor(self, sensor, color=(255, 0, 0)):
         """Draws a sensor on the screen.
         
@@ -426,6 +582,19 @@ class Graphics:
         position = (int(sensor.x), int(sensor.y))
         self.draw_sensor_symbol(position, color)
         
+    def draw_line_scan_sensor(self, sensor, color=(255, 0, 0)):
+        """Draws a line-scan sensor on the screen.
+        
+        Args:
+            sensor (LineScanSensor): sensor to be drawn.
+        """
+        
+        # Draws the strip between its first and last points
+        start = (int(sensor.x[0]), int(sensor.y[0]))
+        end = (int(sensor.x[-1]), int(sensor.y[-1]))
+        pygame.draw.line(self.map, (0, 0, 0), start, end, 4)
+        pygame.draw.line(self.map, color, start, end, 2)
+        
     def draw_sensor_symbol(self, position, color=(255, 0, 0)):
         """Draws a sensor on the screen.
         
@@ -446,7 +615,7 @@ class Graphics:
         """
         
         # Creates a font
-        font = pygame.font.SysFont("Arial", 20)
+        font = self.get_font(20)
         
         # Creates a text with the sensor data
         text = []
@@ -475,24 +644,25 @@ class Graphics:
             self.draw_sensor_symbol((30, 58 + 20*idx), color=sensor_colors[idx])
             self.map.blit(text[idx], (40, 50 + 20*idx))
             
-    def is_out_of_bounds(self, object):
+    def is_out_of_bounds(self, object, arena=None):
         """Checks if the object is out of bounds.
         
         Args:
-            object (Robot or Sensor): object to be checked.
+            object (Robot, Sensor or LineScanSensor): object to be checked.
+            arena (ArrayMap or TiledMap, optional): map whose limits are checked, in its own \
+                unit. Defaults to None (the window limits).
         
         Returns:
             bool: True if the object is out of bounds, False otherwise.
         """
         
-        # Checks if the robot is within the arena limits
-        if (object.x < 0 or
-            object.x > self.map.get_width() or
-            object.y < 0 or
-            object.y > self.map.get_height()):
-            return True
+        if arena is None:
+            width, height = self.map.get_width(), self.map.get_height()
         else:
-            return False
+            width, height = arena.width, arena.height
+        
+        # Checks if the robot is within the arena limits (line-scan sensors have many points)
+        return utils.is_outside(object.x, object.y, width, height)
         
     def show_important_message(self, message):
         """Displays an important message on the screen (centered, with a box around).
@@ -501,7 +671,7 @@ class Graphics:
             message (str): message to be displayed.
         """
 
-        font = pygame.font.SysFont("Arial", 30)
+        font = self.get_font(30)
         text = font.render(message, True, (0, 0, 0))
 
         # Calculates the x and y position to center the text
@@ -524,7 +694,22 @@ class Graphics:
             position (tuple): text position (x, y), in pixels.
         """
         
-        font = pygame.font.SysFont("Arial", fontsize)
+        font = self.get_font(fontsize)
         text = font.render(text, True, color)
         self.map.blit(text, position)
+        
+    def get_font(self, fontsize):
+        """Returns the Arial font in the given size, creating it only once.
+        
+        Args:
+            fontsize (int): font size.
+        
+        Returns:
+            pygame.font.Font: font.
+        """
+        
+        if fontsize not in self.fonts:
+            self.fonts[fontsize] = pygame.font.SysFont("Arial", fontsize)
+        return self.fonts[fontsize]
+
         
\ No newline at end of file
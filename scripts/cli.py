@@ -0,0 +1,327 @@
+import argparse
+import itertools
+import os
+import sys
+import time
+
+# pygame, numpy and the simulation modules are imported inside each subcommand, so
+# that commands and worker processes only load what they use. Only subcommands
+# that open a window (run, replay) import pygame.
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+# Arena and robot set by the parent of the sweep worker processes
+_SETUP_INFO = None
+_MAP_ARRAY = None
+
+
+
+# +===========================================================================+
+# |                                Subcommands                                |
+# +===========================================================================+
+
+def command_run(args):
+    """Runs the simulation in a window (same as main.py)."""
+
+    import main
+
+    main.run(record_path=args.record)
+
+def _init_worker(setup_info, map_array):
+    """Receives the arena and the robot setup in a sweep worker process."""
+
+    global _SETUP_INFO, _MAP_ARRAY
+    _SETUP_INFO = setup_info
+    _MAP_ARRAY = map_array
+
+def _simulate_gains(gains, dt, steps):
+    """Runs one headless simulation in a sweep worker process."""
+
+    from analytics import TrajectoryAnalytics
+    import simulation
+
+    kp, ki, kd = gains
+    analytics = TrajectoryAnalytics(_SETUP_INFO[6])
+    result = simulation.simulate(_SETUP_INFO, _MAP_ARRAY, kp=kp, ki=ki, kd=kd, dt=dt, steps=steps,
+                                 analytics=analytics)
+    result['metrics'] = analytics.row()
+
+    return gains, result
+
+def command_sweep(args):
+    """Runs headless simulations for every combination of PID gains, in parallel."""
+
+    import multiprocessing
+
+    import analytics
+    import utils
+
+    setup_info = utils.read_setup_file()
+    map_array = utils.load_map_array(args.map, setup_info[5])
+
+    grid = list(itertools.product(args.kp, args.ki, args.kd))
+
+    with multiprocessing.Pool(args.workers, initializer=_init_worker,
+                              initargs=(setup_info, map_array)) as pool:
+        results = pool.starmap(_simulate_gains, [(gains, args.dt, args.steps) for gains in grid])
+
+    print(f"{'kp':>10} {'ki':>10} {'kd':>10} {'steps':>10} {'time':>10} {'off map':>8} "
+          f"{'laps':>5} {'best lap':>9} {'error rms':>10}")
+    for (kp, ki, kd), result in results:
+        metrics = result['metrics']
+        print(f"{kp:>10g} {ki:>10g} {kd:>10g} {result['steps']:>10d} "
+              f"{result['time']:>10.2f} {str(result['off_map']):>8} "
+              f"{metrics['laps']:>5d} {metrics['best_lap_time']:>9.2f} {metrics['error_rms']:>10.3f}")
+
+        if args.results is not None:
+            analytics.write_row(args.results, {'kp': kp, 'ki': ki, 'kd': kd, 'off_map': result['off_map'],
+                                               **metrics})
+
+def command_bench(args):
+    """Measures how many headless simulation steps run per second."""
+
+    start = time.perf_counter()
+    import simulation
+    import utils
+    import_time = time.perf_counter() - start
+
+    setup_info = utils.read_setup_file()
+    map_array = utils.load_map_array(args.map, setup_info[5])
+
+    if args.check:
+        import kernel
+
+        gains = [(50, 3, 0.01), (10, 0, 0), (100, 5, 0.1), (200, 0, 0.01)]
+        if kernel.numba is None:
+            print("Numba is not installed: only the 'numpy' backend is checked.")
+        mismatches = kernel.check_backends(setup_info, map_array, gains, dt=args.dt, steps=args.steps)
+        for mismatch in mismatches:
+            print(mismatch)
+        print("Backends agree." if not mismatches else f"{len(mismatches)} mismatches.")
+        return 1 if mismatches else 0
+
+    start = time.perf_counter()
+    if args.backend == 'python':
+        results = [simulation.simulate(setup_info, map_array, dt=args.dt, steps=args.steps)
+                   for _ in range(args.robots)]
+    else:
+        import kernel
+
+        step_kernel = kernel.StepKernel(setup_info, map_array, kp=[50]*args.robots, ki=3, kd=0.01,
+                                        backend=args.backend)
+        step_kernel.run(args.steps, args.dt)
+        results = step_kernel.results(args.dt)
+    elapsed = time.perf_counter() - start
+
+    total_steps = sum(result['steps'] for result in results)
+    print(f"Imports: {1000*import_time:.1f} ms")
+    print(f"Steps: {total_steps} in {elapsed:.3f} s ({total_steps/elapsed:.0f} steps/s)")
+    if any(result['off_map'] for result in results):
+        print("The robot went off the map before the last step.")
+
+def command_tune(args):
+    """Optimizes the PID gains, and optionally the sensor positions, with differential evolution."""
+
+    import numpy as np
+
+    import analytics
+    import tuner
+    import utils
+
+    setup_info = utils.read_setup_file()
+    map_array = utils.load_map_array(args.map, setup_info[5])
+
+    bounds = tuner.gain_bounds(args.kp, args.ki, args.kd)
+    if args.sensors:
+        bounds = np.concatenate((bounds, tuner.sensor_bounds(setup_info, args.sensor_margin)))
+
+    def report(generation, parameters, cost):
+        kp, ki, kd = parameters[:3]
+        print(f"Generation {generation + 1}/{args.generations}: cost {cost:.4f} "
+              f"(kp={kp:.4g}, ki={ki:.4g}, kd={kd:.4g})")
+        if args.results is not None:
+            row = {'generation': generation + 1, 'cost': cost, 'kp': kp, 'ki': ki, 'kd': kd}
+            for idx, (x, y) in enumerate(parameters[3:].reshape(-1, 2)):
+                row[f'sensor_{idx}_x'] = x
+                row[f'sensor_{idx}_y'] = y
+            analytics.write_row(args.results, row)
+
+    parameters, cost = tuner.tune(setup_info, map_array, bounds,
+                                  population_size=args.population, generations=args.generations,
+                                  workers=args.workers, seed=args.seed, callback=report,
+                                  dt=args.dt, steps=args.steps, segment=args.segment,
+                                  max_error_rms=args.max_error_rms, error_weight=args.error_weight,
+                                  backend=args.backend, lap_radius=args.lap_radius)
+
+    kp, ki, kd = parameters[:3]
+    print(f"\nBest gains: kp={kp:.6g}, ki={ki:.6g}, kd={kd:.6g} (cost {cost:.4f})")
+    if args.sensors:
+        print(f"Best sensor positions: {parameters[3:].reshape(-1, 2).tolist()}")
+
+def command_arena(args):
+    """Runs several robots on the same track without a window, released one after another."""
+
+    from arena import Arena
+    from classes import Robot
+    import utils
+
+    setup_info = utils.read_setup_file()
+    map_array = utils.load_map_array(args.map, setup_info[5])
+
+    (ROBOT_WIDTH, INITIAL_MOTOR_SPEED, MAX_MOTOR_SPEED, WHEEL_RADIUS,
+     SENSORS_NUMBER, MAP_DIMENSIONS, ROBOT_START, SENSORS_POSITIONS, _) = setup_info
+
+    # Robot positions are in map pixels, where the robot image is about 120 px wide
+    arena = Arena(map_array, meters_to_units=args.diameter/ROBOT_WIDTH)
+    released = []
+    off_map_steps = []
+    collisions = 0
+
+    for step in range(args.steps):
+
+        # Each robot starts from the setup position, once the previous one has moved away
+        if len(released) < args.robots and step == len(released)*args.interval:
+            robot = Robot(ROBOT_START, ROBOT_WIDTH, INITIAL_MOTOR_SPEED, MAX_MOTOR_SPEED, WHEEL_RADIUS)
+            for sensor_position in SENSORS_POSITIONS:
+                robot.add_sensor(sensor_position, ROBOT_START)
+            arena.add_robot(robot, gains=(args.kp, args.ki, args.kd))
+            released.append(step)
+            off_map_steps.append(None)
+
+        collisions += len(arena.step(args.dt))
+
+        for idx, robot in enumerate(arena.robots):
+            if off_map_steps[idx] is None and utils.is_outside(robot.x, robot.y, *MAP_DIMENSIONS):
+                off_map_steps[idx] = step + 1
+
+    print(f"{'robot':>5} {'released':>9} {'off map':>8}")
+    for idx, (release, off_map) in enumerate(zip(released, off_map_steps)):
+        print(f"{idx:>5d} {release:>9d} {'-' if off_map is None else off_map:>8}")
+    print(f"Collisions: {collisions}")
+
+def command_replay(args):
+    """Draws a trajectory recorded by 'run --record' in a window."""
+
+    import numpy as np
+
+    from classes import Graphics
+    import utils
+
+    setup_info = utils.read_setup_file()
+    trajectory = np.load(args.trajectory)
+
+    gfx = Graphics(setup_info[5], 'images/robot.png', args.map)
+    pygame = utils.import_pygame()
+    clock = pygame.time.Clock()
+
+    for x, y, heading in trajectory:
+
+        # Check if the user closed the window
+        if any(event.type == pygame.QUIT for event in pygame.event.get()):
+            break
+
+        gfx.map.blit(gfx.map_image, (0, 0))
+        gfx.draw_robot(x, y, heading)
+        pygame.display.update()
+        clock.tick(args.fps)
+
+
+
+# +===========================================================================+
+# |                                Entry point                                |
+# +===========================================================================+
+
+def population_size(value):
+    """Parses the --population option of tune (differential evolution needs at least 4 candidates)."""
+
+    size = int(value)
+    if size < 4:
+        raise argparse.ArgumentTypeError(f"the population needs at least 4 candidates, got {size}")
+    return size
+
+def build_parser():
+    """Builds the command-line parser.
+
+    Returns:
+        argparse.ArgumentParser: parser with one subcommand per command_* function.
+    """
+
+    parser = argparse.ArgumentParser(description="Line follower simulator.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run = subparsers.add_parser('run', help="run the simulation in a window")
+    run.add_argument('--record', default=None, help="save the trajectory to this .npy file")
+    run.set_defaults(function=command_run)
+
+    sweep = subparsers.add_parser('sweep', help="run headless simulations over a grid of PID gains")
+    sweep.add_argument('--kp', type=float, nargs='+', default=[50])
+    sweep.add_argument('--ki', type=float, nargs='+', default=[3])
+    sweep.add_argument('--kd', type=float, nargs='+', default=[0.01])
+    sweep.add_argument('--dt', type=float, default=0.01, help="time step, in seconds")
+    sweep.add_argument('--steps', type=int, default=10000)
+    sweep.add_argument('--workers', type=int, default=None, help="defaults to the number of cores")
+    sweep.add_argument('--results', default=None, help="append the run metrics to this CSV file")
+    sweep.add_argument('--map', default='images/map.png')
+    sweep.set_defaults(function=command_sweep)
+
+    bench = subparsers.add_parser('bench', help="measure headless simulation speed")
+    bench.add_argument('--dt', type=float, default=0.01, help="time step, in seconds")
+    bench.add_argument('--steps', type=int, default=10000)
+    bench.add_argument('--robots', type=int, default=1)
+    bench.add_argument('--backend', choices=['python', 'numpy', 'numba', 'auto'], default='python',
+                       help="'python' runs simulation.simulate; the others the fused step kernel")
+    bench.add_argument('--check', action='store_true', help="compare the kernel backends with simulation.simulate")
+    bench.add_argument('--map', default='images/map.png')
+    bench.set_defaults(function=command_bench)
+
+    tune = subparsers.add_parser('tune', help="optimize the PID gains (and sensor positions)")
+    tune.add_argument('--kp', type=float, nargs=2, default=[0, 200], metavar=('MIN', 'MAX'))
+    tune.add_argument('--ki', type=float, nargs=2, default=[0, 20], metavar=('MIN', 'MAX'))
+    tune.add_argument('--kd', type=float, nargs=2, default=[0, 1], metavar=('MIN', 'MAX'))
+    tune.add_argument('--sensors', action='store_true', help="also optimize the sensor positions")
+    tune.add_argument('--sensor-margin', type=float, default=10,
+                      help="maximum displacement of each sensor coordinate from the setup")
+    tune.add_argument('--population', type=population_size, default=32)
+    tune.add_argument('--generations', type=int, default=30)
+    tune.add_argument('--dt', type=float, default=0.01, help="time step, in seconds")
+    tune.add_argument('--steps', type=int, default=5000, help="steps of each simulation")
+    tune.add_argument('--segment', type=int, default=500, help="steps between early termination checks")
+    tune.add_argument('--max-error-rms', type=float, default=0.8, help="RMS error that terminates a candidate")
+    tune.add_argument('--error-weight', type=float, default=1.0)
+    tune.add_argument('--lap-radius', type=float, default=20, help="distance to the start that closes a lap")
+    tune.add_argument('--backend', choices=['numpy', 'numba', 'auto'], default='auto')
+    tune.add_argument('--workers', type=int, default=None, help="defaults to the number of cores")
+    tune.add_argument('--seed', type=int, default=None)
+    tune.add_argument('--results', default=None, help="append the best candidate of each generation to this CSV file")
+    tune.add_argument('--map', default='images/map.png')
+    tune.set_defaults(function=command_tune)
+
+    arena = subparsers.add_parser('arena', help="run several robots on the same track, without a window")
+    arena.add_argument('--robots', type=int, default=5)
+    arena.add_argument('--interval', type=int, default=300, help="steps between the start of two robots")
+    arena.add_argument('--diameter', type=float, default=120,
+                       help="collision diameter of the robots, in map pixels")
+    arena.add_argument('--kp', type=float, default=50)
+    arena.add_argument('--ki', type=float, default=3)
+    arena.add_argument('--kd', type=float, default=0.01)
+    arena.add_argument('--dt', type=float, default=0.01, help="time step, in seconds")
+    arena.add_argument('--steps', type=int, default=10000)
+    arena.add_argument('--map', default='images/map.png')
+    arena.set_defaults(function=command_arena)
+
+    replay = subparsers.add_parser('replay', help="draw a recorded trajectory")
+    replay.add_argument('trajectory', help=".npy file saved by 'run --record'")
+    replay.add_argument('--fps', type=float, default=60)
+    replay.add_argument('--map', default='images/map.png')
+    replay.set_defaults(function=command_replay)
+
+    return parser
+
+def main(argv=None):
+    """Parses the command line and runs the chosen subcommand."""
+
+    args = build_parser().parse_args(argv)
+    return args.function(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,348 @@
+import numpy as np
+
+import tilemap
+
+# Numba is optional: without it, the NumPy backend is used
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+
+# +===========================================================================+
+# |                              Compiled backend                             |
+# +===========================================================================+
+
+def _run_loops(x, y, heading, I, last_error, steps, off_map, error_squares, left_start, laps, lap_steps,
+               sensors_x, sensors_y, sensors_relative_positions, kp, ki, kd, width, wheel_radius, max_motor_speed,
+               start_x, start_y, lap_radius, map_array, map_width, map_height, k, dt):
+    """Runs k steps for every robot, one robot and one step at a time. Compiled with Numba.
+
+    Same computations as StepKernel.run_numpy, written as plain loops. The state arrays \
+    are updated in place.
+    """
+
+    pixels_x, pixels_y = map_array.shape
+    sensors_number = sensors_relative_positions.shape[1]
+    pid_dt = dt if dt != 0 else dt + 1e-5
+    readings = np.empty(sensors_number)
+
+    for i in range(x.shape[0]):
+        for _ in range(k):
+            if off_map[i]:
+                break
+
+            # Read the sensors (1 for light and 0 for dark)
+            for j in range(sensors_number):
+                xi = min(max(int(sensors_x[i, j]), 0), pixels_x - 1)
+                yi = min(max(int(sensors_y[i, j]), 0), pixels_y - 1)
+                readings[j] = 1.0 if map_array[xi, yi] >= 255/2 else 0.0
+
+            # PID control (utils.PID)
+            error = readings[1] - readings[3]
+            P = kp[i]*error
+            D = kd[i]*(error - last_error[i])/pid_dt
+            I[i] += ki[i]*error*pid_dt
+            pid = P + D + I[i]
+            last_error[i] = error
+            error_squares[i] += error*error
+
+            # Robot position (Robot.update_position)
+            left_speed = 2*np.pi*wheel_radius[i]*(max_motor_speed[i] + pid)/60
+            right_speed = 2*np.pi*wheel_radius[i]*(max_motor_speed[i] - pid)/60
+            cos = np.cos(heading[i])
+            sin = np.sin(heading[i])
+            x[i] += (left_speed + right_speed)*cos/2*dt
+            y[i] -= (left_speed + right_speed)*sin/2*dt
+            heading[i] += (right_speed - left_speed)/width[i]*dt
+            if heading[i] > 2*np.pi or heading[i] < -2*np.pi:
+                heading[i] = 0
+            steps[i] += 1
+
+            # Laps (start gate of TrajectoryAnalytics)
+            distance_to_start = np.hypot(x[i] - start_x, y[i] - start_y)
+            if distance_to_start > 2*lap_radius:
+                left_start[i] = True
+            elif left_start[i] and distance_to_start < lap_radius:
+                laps[i] += 1
+                lap_steps[i] = steps[i]
+                left_start[i] = False
+
+            # Sensors position and arena limits
+            cos = np.cos(heading[i])
+            sin = np.sin(heading[i])
+            out = (x[i] < 0 or x[i] > map_width or y[i] < 0 or y[i] > map_height)
+            for j in range(sensors_number):
+                relative_x = sensors_relative_positions[i, j, 0]
+                relative_y = sensors_relative_positions[i, j, 1]
+                sensors_x[i, j] = x[i] + (relative_x*cos - relative_y*sin)
+                sensors_y[i, j] = y[i] - (relative_x*sin + relative_y*cos)
+                if (sensors_x[i, j] < 0 or sensors_x[i, j] > map_width or
+                    sensors_y[i, j] < 0 or sensors_y[i, j] > map_height):
+                    out = True
+            off_map[i] = out
+
+_run_compiled = numba.njit(cache=True)(_run_loops) if numba is not None else None
+
+
+
+# +===========================================================================+
+# |                              StepKernel class                             |
+# +===========================================================================+
+
+class StepKernel:
+    """Fused simulation step (sensing, PID control and motion) for many robots at once.
+
+    Each robot follows the line with the control logic of main.py and stops when it
+    goes off the map, exactly as simulation.simulate does for a single robot. All the
+    robots share the arena and the setup, but each has its own PID gains and may have
+    its own sensor placement.
+    """
+
+    BACKENDS = ['numpy', 'numba']
+
+    def __init__(self, setup_info, map_array, kp, ki, kd, sensors_relative_positions=None, backend='auto',
+                 lap_radius=20):
+        """StepKernel class constructor. Places every robot at the setup start position.
+
+        Laps are counted as in analytics.TrajectoryAnalytics: each time a robot comes back \
+        within lap_radius of the start position after having gone further than twice that \
+        distance.
+
+        Args:
+            setup_info (tuple): robot parameters, as returned by utils.read_setup_file.
+            map_array (np.ndarray, ArrayMap or TiledMap): arena grayscale array (see \
+                utils.load_map_array) or map (see tilemap.as_map). The 'numba' backend \
+                needs the map in memory (array or ArrayMap).
+            kp, ki, kd (float or np.ndarray): PID gains, one per robot.
+            sensors_relative_positions (np.ndarray, optional): sensor positions relative \
+                to each robot, shape (robots, sensors, 2). Defaults to the setup positions.
+            backend (str, optional): 'numba', 'numpy' or 'auto' (Numba if installed). \
+                Defaults to 'auto'.
+            lap_radius (float, optional): distance to the start that closes a lap, in the \
+                map's unit. Defaults to 20.
+        """
+
+        self.arena = tilemap.as_map(map_array)
+        in_memory = isinstance(self.arena, tilemap.ArrayMap)
+
+        if backend == 'auto':
+            backend = 'numba' if numba is not None and in_memory else 'numpy'
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}'. Use one of: {', '.join(self.BACKENDS)}.")
+        if backend == 'numba' and numba is None:
+            raise ImportError("The 'numba' backend needs the numba package.")
+        if backend == 'numba' and not in_memory:
+            raise ValueError("The 'numba' backend needs the map in memory (array or ArrayMap).")
+        self.backend = backend
+
+        (ROBOT_WIDTH, INITIAL_MOTOR_SPEED, MAX_MOTOR_SPEED, WHEEL_RADIUS,
+         SENSORS_NUMBER, MAP_DIMENSIONS, ROBOT_START, SENSORS_POSITIONS, _) = setup_info
+
+        kp, ki, kd = np.broadcast_arrays(*(np.atleast_1d(np.asarray(gain, dtype=float)) for gain in (kp, ki, kd)))
+        robots_number = len(kp)
+        self.kp, self.ki, self.kd = kp.copy(), ki.copy(), kd.copy()
+
+        if sensors_relative_positions is None:
+            sensors_relative_positions = SENSORS_POSITIONS
+        self.sensors_relative_positions = np.ascontiguousarray(np.broadcast_to(
+            np.asarray(sensors_relative_positions, dtype=float),
+            (robots_number, len(SENSORS_POSITIONS), 2)))
+
+        if backend == 'numba':
+            self.map_array = np.ascontiguousarray(self.arena.array, dtype=float)
+
+        # Robot parameters
+        self.width = np.full(robots_number, float(ROBOT_WIDTH))
+        self.wheel_radius = np.full(robots_number, float(WHEEL_RADIUS))
+        self.max_motor_speed = np.full(robots_number, float(MAX_MOTOR_SPEED))
+
+        # Robot state
+        self.start_x, self.start_y = float(ROBOT_START[0]), float(ROBOT_START[1])
+        self.lap_radius = float(lap_radius)
+        self.x = np.full(robots_number, float(ROBOT_START[0]))
+        self.y = np.full(robots_number, float(ROBOT_START[1]))
+        self.heading = np.full(robots_number, float(ROBOT_START[2]))
+        self.I = np.zeros(robots_number)
+        self.last_error = np.zeros(robots_number)
+        self.steps = np.zeros(robots_number, dtype=np.int64)
+        self.off_map = np.zeros(robots_number, dtype=bool)
+
+        # Accumulated squared controller error
+        self.error_squares = np.zeros(robots_number)
+
+        # Completed laps and step count at the end of the last one
+        self.left_start = np.zeros(robots_number, dtype=bool)
+        self.laps = np.zeros(robots_number, dtype=np.int64)
+        self.lap_steps = np.zeros(robots_number, dtype=np.int64)
+        self.sensors_x, self.sensors_y = self.sensors_positions()
+
+    def __len__(self):
+        return len(self.x)
+
+    def sensors_positions(self):
+        """Computes the positions of every sensor of every robot (see utils.sensors_positions).
+
+        Returns:
+            np.ndarray: sensors horizontal positions, shape (robots, sensors).
+            np.ndarray: sensors vertical positions, shape (robots, sensors).
+        """
+
+        cos = np.cos(self.heading)[:, np.newaxis]
+        sin = np.sin(self.heading)[:, np.newaxis]
+        relative_x = self.sensors_relative_positions[:, :, 0]
+        relative_y = self.sensors_relative_positions[:, :, 1]
+
+        return (self.x[:, np.newaxis] + (relative_x*cos - relative_y*sin),
+                self.y[:, np.newaxis] - (relative_x*sin + relative_y*cos)) # y-axis is inverted
+
+    def run(self, k, dt):
+        """Runs k steps for every robot still on the map.
+
+        Args:
+            k (int): number of steps.
+            dt (float): time step, in seconds.
+        """
+
+        if self.backend == 'numba':
+            _run_compiled(self.x, self.y, self.heading, self.I, self.last_error, self.steps, self.off_map,
+                          self.error_squares, self.left_start, self.laps, self.lap_steps,
+                          self.sensors_x, self.sensors_y, self.sensors_relative_positions,
+                          self.kp, self.ki, self.kd, self.width, self.wheel_radius, self.max_motor_speed,
+                          self.start_x, self.start_y, self.lap_radius, self.map_array, float(self.arena.width), float(self.arena.height), k, dt)
+        else:
+            self.run_numpy(k, dt)
+
+    def run_numpy(self, k, dt):
+        """Runs k steps with NumPy, every robot at once.
+
+        Args:
+            k (int): number of steps.
+            dt (float): time step, in seconds.
+        """
+
+        map_width, map_height = self.arena.width, self.arena.height
+        pid_dt = dt if dt != 0 else dt + 1e-5
+
+        for _ in range(k):
+            active = ~self.off_map
+            if not active.any():
+                break
+
+            # Read the sensors (1 for light and 0 for dark)
+            readings = (self.arena.sample(self.sensors_x, self.sensors_y) >= 255/2).astype(float)
+
+            # PID control (utils.PID)
+            error = readings[:, 1] - readings[:, 3]
+            P = self.kp*error
+            D = self.kd*(error - self.last_error)/pid_dt
+            I = self.I + self.ki*error*pid_dt
+            pid = P + D + I
+
+            # Robot position (Robot.update_position)
+            left_speed = 2*np.pi*self.wheel_radius*(self.max_motor_speed + pid)/60
+            right_speed = 2*np.pi*self.wheel_radius*(self.max_motor_speed - pid)/60
+            x = self.x + (left_speed + right_speed)*np.cos(self.heading)/2*dt
+            y = self.y - (left_speed + right_speed)*np.sin(self.heading)/2*dt
+            heading = self.heading + (right_speed - left_speed)/self.width*dt
+            heading[(heading > 2*np.pi) | (heading < -2*np.pi)] = 0
+
+            # Robots off the map keep their last state
+            self.I = np.where(active, I, self.I)
+            self.last_error = np.where(active, error, self.last_error)
+            self.x = np.where(active, x, self.x)
+            self.y = np.where(active, y, self.y)
+            self.heading = np.where(active, heading, self.heading)
+            self.steps += active
+            self.error_squares += np.where(active, error*error, 0)
+
+            # Laps (start gate of TrajectoryAnalytics)
+            distance_to_start = np.hypot(self.x - self.start_x, self.y - self.start_y)
+            lap = active & self.left_start & (distance_to_start < self.lap_radius)
+            self.laps += lap
+            self.lap_steps = np.where(lap, self.steps, self.lap_steps)
+            self.left_start = (self.left_start | (active & (distance_to_start > 2*self.lap_radius))) & ~lap
+
+            # Sensors position and arena limits
+            self.sensors_x, self.sensors_y = self.sensors_positions()
+            self.off_map = (
+                (self.x < 0) | (self.x > map_width) | (self.y < 0) | (self.y > map_height) |
+                np.any((self.sensors_x < 0) | (self.sensors_x > map_width) |
+                       (self.sensors_y < 0) | (self.sensors_y > map_height), axis=1))
+
+    def results(self, dt):
+        """Returns the outcome of every robot, in the format of simulation.simulate.
+
+        Args:
+            dt (float): time step used, in seconds.
+
+        Returns:
+            list: one dict per robot.
+        """
+
+        return [{'steps': int(self.steps[i]), 'time': self.steps[i]*dt, 'off_map': bool(self.off_map[i]),
+                 'x': self.x[i], 'y': self.y[i], 'heading': self.heading[i]}
+                for i in range(len(self))]
+
+    def error_rms(self):
+        """Returns the root mean square of the controller error of every robot so far.
+
+        Returns:
+            np.ndarray: one value per robot (0 for robots that did not move yet).
+        """
+
+        return np.sqrt(self.error_squares/np.maximum(self.steps, 1))
+
+    def mean_lap_time(self, dt):
+        """Returns the mean lap time of every robot so far (see analytics.TrajectoryAnalytics).
+
+        Args:
+            dt (float): time step used, in seconds.
+
+        Returns:
+            np.ndarray: one value per robot, in seconds (NaN for robots without a full lap).
+        """
+
+        return np.where(self.laps > 0, self.lap_steps*dt/np.maximum(self.laps, 1), np.nan)
+
+def check_backends(setup_info, map_array, gains, dt=0.01, steps=1000):
+    """Compares every available backend with simulation.simulate, robot by robot.
+
+    Steps and off-map flags must be equal, and poses equal within 1e-9. The 'numba' \
+    backend is only compared if Numba is installed (see tests/test_kernel.py).
+
+    Args:
+        setup_info (tuple): robot parameters, as returned by utils.read_setup_file.
+        map_array (np.ndarray): arena grayscale array.
+        gains (list): PID gains (kp, ki, kd) of each robot.
+        dt (float, optional): time step, in seconds. Defaults to 0.01.
+        steps (int, optional): number of steps. Defaults to 1000.
+
+    Returns:
+        list: description of each mismatch found (empty if all backends agree).
+    """
+
+    import simulation
+
+    expected = [simulation.simulate(setup_info, map_array, kp, ki, kd, dt=dt, steps=steps) for kp, ki, kd in gains]
+    kp, ki, kd = np.asarray(gains, dtype=float).T
+    mismatches = []
+
+    for backend in StepKernel.BACKENDS:
+        if backend == 'numba' and numba is None:
+            continue
+
+        kernel = StepKernel(setup_info, map_array, kp, ki, kd, backend=backend)
+        kernel.run(steps, dt)
+
+        for idx, (reference, result) in enumerate(zip(expected, kernel.results(dt))):
+            same = (reference['steps'] == result['steps'] and
+                    reference['off_map'] == result['off_map'] and
+                    np.allclose([reference['x'], reference['y'], reference['heading']],
+                                [result['x'], result['y'], result['heading']], rtol=0, atol=1e-9))
+            if not same:
+                mismatches.append(f"{backend}: robot {idx} (gains {gains[idx]}) "
+                                  f"expected {reference}, got {result}")
+
+    return mismatches
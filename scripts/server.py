@@ -0,0 +1,413 @@
+import argparse
+import asyncio
+import struct
+
+import numpy as np
+
+from classes import Robot
+import tilemap
+import utils
+
+
+
+# +===========================================================================+
+# |                                  Protocol                                 |
+# +===========================================================================+
+#
+# Every message is a frame: a header (message type, payload length) followed
+# by the payload. All values are little-endian.
+#
+#   HELLO     (server -> client, on connect): mode, dt, number of sensors
+#   COMMAND   (client -> server): left and right motor speeds (rpm), steps (at most MAX_STEPS)
+#   TELEMETRY (server -> client): number of records, then the records
+#   CLOSE     (client -> server): ends the session
+#
+# In lockstep mode, each COMMAND runs "steps" simulation steps and is answered
+# with one TELEMETRY frame holding a record per step. In free-running mode the
+# simulation advances on its own, streaming a TELEMETRY frame every batch of
+# steps, and COMMAND only changes the motor speeds.
+
+HEADER = struct.Struct('<BI')
+HELLO = struct.Struct('<BfH')
+COMMAND = struct.Struct('<ffI')
+COUNT = struct.Struct('<I')
+RECORD = struct.Struct('<IfffB') # step, x, y, heading, out of bounds (+ one byte per sensor)
+
+MSG_HELLO = 0
+MSG_COMMAND = 1
+MSG_TELEMETRY = 2
+MSG_CLOSE = 3
+
+MODES = {'lockstep': 0, 'free-running': 1}
+
+# A COMMAND runs at most MAX_STEPS steps (the TELEMETRY count tells how many ran),
+# and long batches yield to the other sessions every CHUNK_STEPS steps
+MAX_STEPS = 10000
+CHUNK_STEPS = 200
+
+
+async def read_frame(reader):
+    """Reads a frame from a stream.
+
+    Args:
+        reader (asyncio.StreamReader): stream.
+
+    Returns:
+        int: message type.
+        bytes: payload.
+    """
+
+    kind, length = HEADER.unpack(await reader.readexactly(HEADER.size))
+    payload = await reader.readexactly(length)
+
+    return kind, payload
+
+def write_frame(writer, kind, payload=b''):
+    """Writes a frame to a stream.
+
+    Args:
+        writer (asyncio.StreamWriter): stream.
+        kind (int): message type.
+        payload (bytes, optional): message content. Defaults to b''.
+    """
+
+    writer.write(HEADER.pack(kind, len(payload)) + payload)
+
+def telemetry_dtype(sensors_number):
+    """Returns the numpy type of a telemetry record.
+
+    Args:
+        sensors_number (int): number of sensors of the robot.
+
+    Returns:
+        np.dtype: record type, matching RECORD followed by the sensor readings.
+    """
+
+    return np.dtype([('step', '<u4'), ('x', '<f4'), ('y', '<f4'), ('heading', '<f4'),
+                     ('out', 'u1'), ('sensors', 'u1', (sensors_number,))])
+
+def decode_telemetry(payload, sensors_number):
+    """Decodes a TELEMETRY payload.
+
+    Args:
+        payload (bytes): message content.
+        sensors_number (int): number of sensors of the robot.
+
+    Returns:
+        np.ndarray: records, with fields step, x, y, heading, out and sensors.
+    """
+
+    count, = COUNT.unpack_from(payload)
+    return np.frombuffer(payload, dtype=telemetry_dtype(sensors_number), count=count, offset=COUNT.size)
+
+
+
+# +===========================================================================+
+# |                                Session class                              |
+# +===========================================================================+
+
+class Session:
+    """Simulation of one robot driven by one client."""
+
+    def __init__(self, map_array, setup_info, dt):
+        """Session class constructor. Builds the robot described by the setup.
+
+        Args:
+            map_array (np.ndarray, ArrayMap or TiledMap): arena grayscale array or map \
+                (see tilemap.as_map), shared between sessions.
+            setup_info (tuple): robot parameters, as returned by utils.read_setup_file.
+            dt (float): simulation time step, in seconds.
+        """
+
+        (ROBOT_WIDTH, INITIAL_MOTOR_SPEED, MAX_MOTOR_SPEED, WHEEL_RADIUS,
+         SENSORS_NUMBER, MAP_DIMENSIONS, ROBOT_START, SENSORS_POSITIONS, _) = setup_info
+
+        self.arena = tilemap.as_map(map_array)
+        self.dt = dt
+        self.step_count = 0
+
+        self.robot = Robot(initial_position=ROBOT_START,
+                           width=ROBOT_WIDTH,
+                           initial_motor_speed=INITIAL_MOTOR_SPEED,
+                           max_motor_speed=MAX_MOTOR_SPEED,
+                           wheel_radius=WHEEL_RADIUS)
+
+        # Sensors are read all at once from their relative positions
+        self.sensors_positions = np.asarray(SENSORS_POSITIONS, dtype=float)
+
+    @property
+    def sensors_number(self):
+        """int: number of sensors of the robot."""
+        return len(self.sensors_positions)
+
+    def set_command(self, left_speed, right_speed):
+        """Sets the motor speeds.
+
+        Args:
+            left_speed, right_speed (float): motor speeds, in rpm.
+        """
+
+        self.robot.left_motor.set_speed(left_speed)
+        self.robot.right_motor.set_speed(right_speed)
+
+    def step(self):
+        """Runs one simulation step.
+
+        Returns:
+            bytes: telemetry record after the step.
+        """
+
+        robot = self.robot
+        robot.update_position(self.dt)
+        self.step_count += 1
+
+        x, y = utils.sensors_positions(self.sensors_positions, (robot.x, robot.y, robot.heading))
+
+        # 1 for light and 0 for dark, as in Sensor.read_data
+        readings = self.arena.sample(x, y) >= 255/2
+
+        # Checks if the robot or any sensor is out of the arena limits
+        out = utils.is_outside(np.append(x, robot.x), np.append(y, robot.y), self.arena.width, self.arena.height)
+
+        return (RECORD.pack(self.step_count, robot.x, robot.y, robot.heading, out) +
+                readings.astype(np.uint8).tobytes())
+
+    async def run_async(self, steps):
+        """Runs several simulation steps in chunks, letting the other sessions run in between.
+
+        Args:
+            steps (int): number of steps.
+
+        Returns:
+            bytes: TELEMETRY payload with one record per step.
+        """
+
+        records = []
+        for first in range(0, steps, CHUNK_STEPS):
+            records.extend(self.step() for _ in range(min(CHUNK_STEPS, steps - first)))
+            await asyncio.sleep(0)
+
+        return COUNT.pack(steps) + b''.join(records)
+
+
+
+# +===========================================================================+
+# |                         SimulationServer class                            |
+# +===========================================================================+
+
+class SimulationServer:
+    """Hosts many simulation sessions in one process, one per connection."""
+
+    def __init__(self, map_array, setup_info, dt=0.01, mode='lockstep', batch_size=100, realtime=False):
+        """SimulationServer class constructor.
+
+        Args:
+            map_array (np.ndarray, ArrayMap or TiledMap): arena grayscale array or map.
+            setup_info (tuple): robot parameters, as returned by utils.read_setup_file.
+            dt (float, optional): simulation time step, in seconds. Defaults to 0.01.
+            mode (str, optional): 'lockstep' or 'free-running'. Defaults to 'lockstep'.
+            batch_size (int, optional): steps per TELEMETRY frame in free-running mode. \
+                Defaults to 100.
+            realtime (bool, optional): paces free-running sessions to the simulated time \
+                instead of running as fast as possible. Defaults to False.
+        """
+
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode '{mode}'. Use one of: {', '.join(MODES)}.")
+
+        self.map_array = map_array
+        self.setup_info = setup_info
+        self.dt = dt
+        self.mode = mode
+        self.batch_size = batch_size
+        self.realtime = realtime
+        self.sessions = set()
+
+    async def handle(self, reader, writer):
+        """Runs the session of a new connection until the client leaves.
+
+        Args:
+            reader (asyncio.StreamReader): connection input.
+            writer (asyncio.StreamWriter): connection output.
+        """
+
+        session = Session(self.map_array, self.setup_info, self.dt)
+        self.sessions.add(session)
+
+        try:
+            write_frame(writer, MSG_HELLO, HELLO.pack(MODES[self.mode], self.dt, session.sensors_number))
+            await writer.drain()
+
+            if self.mode == 'lockstep':
+                await self.run_lockstep(session, reader, writer)
+            else:
+                await self.run_free(session, reader, writer)
+
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass # Client left without sending CLOSE
+        except struct.error:
+            pass # Malformed payload: the session is closed
+        finally:
+            self.sessions.discard(session)
+            writer.close()
+
+    async def run_lockstep(self, session, reader, writer):
+        """Steps the session only when the client sends a command."""
+
+        while True:
+            kind, payload = await read_frame(reader)
+            if kind == MSG_CLOSE:
+                return
+            if kind == MSG_COMMAND:
+                left_speed, right_speed, steps = COMMAND.unpack(payload)
+                session.set_command(left_speed, right_speed)
+                write_frame(writer, MSG_TELEMETRY, await session.run_async(min(steps, MAX_STEPS)))
+                await writer.drain()
+
+    async def run_free(self, session, reader, writer):
+        """Steps the session continuously while commands are received in the background."""
+
+        closed = asyncio.Event()
+
+        async def receive():
+            try:
+                while True:
+                    kind, payload = await read_frame(reader)
+                    if kind == MSG_CLOSE:
+                        break
+                    if kind == MSG_COMMAND:
+                        left_speed, right_speed, _ = COMMAND.unpack(payload)
+                        session.set_command(left_speed, right_speed)
+            except (asyncio.IncompleteReadError, ConnectionError, struct.error):
+                pass
+            closed.set()
+
+        receiver = asyncio.create_task(receive())
+        pause = self.dt*self.batch_size if self.realtime else 0
+
+        try:
+            while not closed.is_set():
+                write_frame(writer, MSG_TELEMETRY, await session.run_async(self.batch_size))
+                await writer.drain()
+                await asyncio.sleep(pause) # Lets the other sessions run
+        finally:
+            receiver.cancel()
+
+    async def serve(self, host='127.0.0.1', port=8765, path=None):
+        """Accepts connections forever.
+
+        Args:
+            host (str, optional): TCP address. Defaults to '127.0.0.1'.
+            port (int, optional): TCP port. Defaults to 8765.
+            path (str, optional): Unix socket path, used instead of TCP if given.
+        """
+
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle, path)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+
+        async with server:
+            await server.serve_forever()
+
+
+
+# +===========================================================================+
+# |                         SimulationClient class                            |
+# +===========================================================================+
+
+class SimulationClient:
+    """Client side of the protocol, for test harnesses written in Python."""
+
+    def __init__(self, reader, writer):
+        """SimulationClient class constructor. Use SimulationClient.connect instead."""
+
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host='127.0.0.1', port=8765, path=None):
+        """Connects to a server and reads its HELLO message.
+
+        Args:
+            host (str, optional): TCP address. Defaults to '127.0.0.1'.
+            port (int, optional): TCP port. Defaults to 8765.
+            path (str, optional): Unix socket path, used instead of TCP if given.
+
+        Returns:
+            SimulationClient: connected client.
+        """
+
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+
+        client = cls(reader, writer)
+        _, payload = await read_frame(reader)
+        mode, client.dt, client.sensors_number = HELLO.unpack(payload)
+        client.mode = {value: key for key, value in MODES.items()}[mode]
+
+        return client
+
+    async def command(self, left_speed, right_speed, steps=1):
+        """Sends motor speeds. In lockstep mode, waits for the telemetry of the steps run.
+
+        Args:
+            left_speed, right_speed (float): motor speeds, in rpm.
+            steps (int, optional): steps to run (lockstep mode only). Defaults to 1.
+
+        Returns:
+            np.ndarray: telemetry records (lockstep mode) or None (free-running mode).
+        """
+
+        write_frame(self.writer, MSG_COMMAND, COMMAND.pack(left_speed, right_speed, steps))
+        await self.writer.drain()
+
+        if self.mode == 'lockstep':
+            return await self.telemetry()
+
+    async def telemetry(self):
+        """Waits for the next TELEMETRY frame.
+
+        Returns:
+            np.ndarray: telemetry records.
+        """
+
+        kind, payload = await read_frame(self.reader)
+        while kind != MSG_TELEMETRY:
+            kind, payload = await read_frame(self.reader)
+
+        return decode_telemetry(payload, self.sensors_number)
+
+    async def close(self):
+        """Ends the session."""
+
+        write_frame(self.writer, MSG_CLOSE)
+        await self.writer.drain()
+        self.writer.close()
+
+
+
+# +===========================================================================+
+# |                                Entry point                                |
+# +===========================================================================+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Line follower simulation server.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', default=None, help="Unix socket path (instead of TCP).")
+    parser.add_argument('--mode', choices=list(MODES), default='lockstep')
+    parser.add_argument('--dt', type=float, default=0.01, help="Time step, in seconds.")
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--realtime', action='store_true')
+    args = parser.parse_args()
+
+    setup_info = utils.read_setup_file()
+    map_array = utils.load_map_array('images/map.png', setup_info[5])
+
+    server = SimulationServer(map_array, setup_info, dt=args.dt, mode=args.mode,
+                              batch_size=args.batch_size, realtime=args.realtime)
+    asyncio.run(server.serve(args.host, args.port, args.unix))
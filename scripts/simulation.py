@@ -0,0 +1,88 @@
+import numpy as np
+
+from classes import Robot
+import tilemap
+import utils
+
+
+
+# +===========================================================================+
+# |                           Headless simulation                             |
+# +===========================================================================+
+
+def simulate(setup_info, map_array, kp=50, ki=3, kd=0.01, dt=0.01, steps=10000, record=False,
+             analytics=None):
+    """Runs the simulation of main.py without a window, with a fixed time step.
+
+    The robot follows the line with the same PID control logic as main.py, until it
+    goes off the map or the number of steps is reached.
+
+    Args:
+        setup_info (tuple): robot parameters, as returned by utils.read_setup_file.
+        map_array (np.ndarray, ArrayMap or TiledMap): arena grayscale array (see \
+            utils.load_map_array) or map (see tilemap.as_map). Positions are in the map's unit.
+        kp (float, optional): proportional gain. Defaults to 50.
+        ki (float, optional): integral gain. Defaults to 3.
+        kd (float, optional): derivative gain. Defaults to 0.01.
+        dt (float, optional): time step, in seconds. Defaults to 0.01.
+        steps (int, optional): maximum number of steps. Defaults to 10000.
+        record (bool, optional): keeps the robot position at every step. Defaults to False.
+        analytics (TrajectoryAnalytics, optional): receives every step, to compute run \
+            metrics without keeping the trajectory. Defaults to None.
+
+    Returns:
+        dict: steps run, simulated time, whether the robot went off the map and its final \
+            position. If record is True, also the trajectory (x, y, heading) of every step.
+    """
+
+    (ROBOT_WIDTH, INITIAL_MOTOR_SPEED, MAX_MOTOR_SPEED, WHEEL_RADIUS,
+     SENSORS_NUMBER, MAP_DIMENSIONS, ROBOT_START, SENSORS_POSITIONS, _) = setup_info
+
+    robot = Robot(initial_position=ROBOT_START,
+                  width=ROBOT_WIDTH,
+                  initial_motor_speed=INITIAL_MOTOR_SPEED,
+                  max_motor_speed=MAX_MOTOR_SPEED,
+                  wheel_radius=WHEEL_RADIUS)
+
+    arena = tilemap.as_map(map_array)
+    sensors_relative_positions = np.asarray(SENSORS_POSITIONS, dtype=float)
+    x, y = utils.sensors_positions(sensors_relative_positions, ROBOT_START)
+
+    last_error = 0
+    I = 0 # PID integral
+    off_map = False
+    trajectory = []
+    step = 0
+
+    while step < steps and not off_map:
+
+        # Read the sensors (1 for light and 0 for dark)
+        readings = (arena.sample(x, y) >= 255/2).astype(int)
+
+        # Same control logic as main.py
+        error = readings[1] - readings[3]
+        pid, I = utils.PID(kp=kp, ki=ki, kd=kd, I=I,
+                           error=error, last_error=last_error, dt=dt)
+        last_error = error
+        robot.left_motor.set_speed(robot.left_motor.max_motor_speed + pid)
+        robot.right_motor.set_speed(robot.right_motor.max_motor_speed - pid)
+
+        # Update robot and sensors position
+        robot.update_position(dt)
+        x, y = utils.sensors_positions(sensors_relative_positions, (robot.x, robot.y, robot.heading))
+        step += 1
+
+        if record:
+            trajectory.append((robot.x, robot.y, robot.heading))
+        if analytics is not None:
+            analytics.update(dt, robot.x, robot.y, readings, error, pid, robot.left_motor.max_motor_speed)
+
+        # Stop if the robot or any sensor is out of bounds
+        off_map = utils.is_outside(np.append(x, robot.x), np.append(y, robot.y), arena.width, arena.height)
+
+    result = {'steps': step, 'time': step*dt, 'off_map': off_map,
+              'x': robot.x, 'y': robot.y, 'heading': robot.heading}
+    if record:
+        result['trajectory'] = np.array(trajectory).reshape(-1, 3)
+
+    return result
@@ -0,0 +1,390 @@
+from collections import OrderedDict
+
+import numpy as np
+
+import utils
+
+
+
+# +===========================================================================+
+# |                               ArrayMap class                              |
+# +===========================================================================+
+#
+# Maps are read by the simulation through a common interface, implemented by
+# ArrayMap and TiledMap:
+#
+#   sample(x, y, bilinear=False): intensities (0 to 255) at many positions
+#   width, height: arena dimensions, in the unit of the positions
+
+class ArrayMap:
+    """Arena held in memory as a grayscale array. Positions are given in pixels of the array."""
+
+    def __init__(self, array):
+        """ArrayMap class constructor.
+
+        Args:
+            array (np.ndarray): grayscale intensities (0 to 255), indexed as [x, y] \
+                (see utils.load_map_array).
+        """
+
+        self.array = np.asarray(array)
+
+    @property
+    def width(self):
+        """int: arena width, in pixels."""
+        return self.array.shape[0]
+
+    @property
+    def height(self):
+        """int: arena height, in pixels."""
+        return self.array.shape[1]
+
+    def sample(self, x, y, bilinear=False):
+        """Samples the map at many positions at once (see utils.sample_grayscale).
+
+        Args:
+            x, y (np.ndarray): sample positions, in pixels.
+            bilinear (bool, optional): interpolates between the four closest pixels. \
+                Defaults to False.
+
+        Returns:
+            np.ndarray: sampled intensities (0 to 255).
+        """
+
+        return utils.sample_grayscale(self.array, x, y, bilinear)
+
+def as_map(arena):
+    """Returns the arena as a map (ArrayMap or TiledMap), wrapping grayscale arrays.
+
+    Args:
+        arena (np.ndarray, ArrayMap or TiledMap): arena.
+
+    Returns:
+        ArrayMap or TiledMap: arena with the map interface.
+    """
+
+    if isinstance(arena, np.ndarray):
+        return ArrayMap(arena)
+    return arena
+
+
+
+# +===========================================================================+
+# |                               TiledMap class                              |
+# +===========================================================================+
+
+class TiledMap:
+    """Arena stored as a memory-mapped grayscale array, read in fixed-size tiles.
+
+    The whole arena never needs to fit in memory: tiles are copied from the file
+    on demand and kept in a least-recently-used cache. Positions are given in
+    meters (world coordinates) and converted to map pixels with the map's own
+    scale, independently of the window scale.
+    """
+
+    def __init__(self, path, meters_to_pixels=3779.52, tile_size=512, max_tiles=64, outside_value=255):
+        """TiledMap class constructor. Opens an existing map file (see TiledMap.create).
+
+        Args:
+            path (str): map file path (.npy, grayscale uint8, indexed as [x, y]).
+            meters_to_pixels (float, optional): map scale, in pixels per meter. Defaults to 3779.52.
+            tile_size (int, optional): tile side, in pixels. Defaults to 512.
+            max_tiles (int, optional): maximum number of tiles kept in memory. Defaults to 64.
+            outside_value (int, optional): intensity read outside the map (light, i.e. no line). \
+                Defaults to 255.
+        """
+
+        self.path = path
+        self.meters_to_pixels = meters_to_pixels
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self.outside_value = outside_value
+
+        # The file is only mapped: nothing is read until a tile is requested
+        self.data = np.load(path, mmap_mode='r')
+        self.width_pixels, self.height_pixels = self.data.shape
+
+        # Least-recently-used tile cache: (tile_x, tile_y) -> array
+        self.tiles = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def create(cls, path, width, height, meters_to_pixels=3779.52, fill=255, **kwargs):
+        """Creates a blank map file and opens it.
+
+        Args:
+            path (str): map file path (.npy).
+            width (float): arena width, in meters.
+            height (float): arena height, in meters.
+            meters_to_pixels (float, optional): map scale, in pixels per meter. Defaults to 3779.52.
+            fill (int, optional): initial intensity of every pixel. Defaults to 255 (white).
+
+        Returns:
+            TiledMap: the new map.
+        """
+
+        shape = (int(np.ceil(width*meters_to_pixels)), int(np.ceil(height*meters_to_pixels)))
+        data = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=shape)
+
+        # Fills the file one strip at a time to keep memory usage bounded
+        strip = max(1, (1 << 24)//shape[1])
+        for x in range(0, shape[0], strip):
+            data[x:x + strip] = fill
+        data.flush()
+        del data
+
+        return cls(path, meters_to_pixels, **kwargs)
+
+    @classmethod
+    def from_array(cls, source, path, meters_to_pixels=3779.52, scale=1, **kwargs):
+        """Converts a grayscale or RGB array into a map file, one strip at a time, and opens it.
+
+        The source can be a memory-mapped .npy file, so neither it nor the map needs to fit
+        in memory. Each pixel of the source becomes a scale x scale block of the map, so a
+        track can be drawn at a lower resolution than the map's.
+
+        Args:
+            source (str or np.ndarray): source .npy file path, or array, indexed as [x, y] \
+                (grayscale, uint8) or [x, y, channel] (RGB, uint8).
+            path (str): map file path (.npy).
+            meters_to_pixels (float, optional): map scale, in pixels per meter. Defaults to 3779.52.
+            scale (int, optional): map pixels per source pixel, along each axis. Defaults to 1.
+
+        Returns:
+            TiledMap: the new map.
+        """
+
+        if isinstance(source, str):
+            source = np.load(source, mmap_mode='r')
+
+        shape = (source.shape[0]*scale, source.shape[1]*scale)
+        data = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=shape)
+
+        # Source columns converted at once, so that each strip of the map is about 16 MB
+        strip = max(1, (1 << 24)//shape[1]//scale)
+        for x in range(0, source.shape[0], strip):
+            block = np.asarray(source[x:x + strip])
+
+            # Average of the RGB values (as utils.surface_to_grayscale), in integers
+            if block.ndim == 3:
+                block = block[:, :, :3].sum(axis=2, dtype=np.uint16)//3
+            block = block.astype(np.uint8, copy=False)
+
+            data[x*scale:(x + strip)*scale] = block.repeat(scale, axis=0).repeat(scale, axis=1)
+        data.flush()
+        del data
+
+        return cls(path, meters_to_pixels, **kwargs)
+
+    @classmethod
+    def from_image(cls, image_path, path, meters_to_pixels=3779.52, scale=1, **kwargs):
+        """Converts an image into a map file, one strip at a time, and opens it (see TiledMap.from_array).
+
+        The image is decoded at its own resolution, so it must fit in memory: large arenas \
+        are drawn at a lower resolution and enlarged with scale.
+
+        Args:
+            image_path (str): arena image path.
+            path (str): map file path (.npy).
+            meters_to_pixels (float, optional): map scale, in pixels per meter. Defaults to 3779.52.
+            scale (int, optional): map pixels per image pixel, along each axis. Defaults to 1.
+
+        Returns:
+            TiledMap: the new map.
+        """
+
+        pygame = utils.import_pygame()
+
+        image = pygame.image.load(image_path)
+        if image.get_bitsize() not in (24, 32):
+            # Paletted images are expanded to RGB (pixels3d needs 24 or 32 bits per pixel)
+            rgb = pygame.Surface(image.get_size(), depth=24)
+            rgb.blit(image, (0, 0))
+            image = rgb
+
+        # The pixels are read in place, without a copy of the whole image
+        pixels = pygame.surfarray.pixels3d(image)
+        tiled_map = cls.from_array(pixels, path, meters_to_pixels, scale, **kwargs)
+        del pixels
+
+        return tiled_map
+
+    @property
+    def width(self):
+        """float: arena width, in meters."""
+        return self.width_pixels/self.meters_to_pixels
+
+    @property
+    def height(self):
+        """float: arena height, in meters."""
+        return self.height_pixels/self.meters_to_pixels
+
+    def get_tile(self, tile_x, tile_y):
+        """Returns a tile, loading it from the file if it is not cached.
+
+        Args:
+            tile_x, tile_y (int): tile indices.
+
+        Returns:
+            np.ndarray: tile intensities, indexed as [x, y].
+        """
+
+        key = (tile_x, tile_y)
+
+        if key in self.tiles:
+            self.hits += 1
+            self.tiles.move_to_end(key)
+            return self.tiles[key]
+
+        # Copies the tile out of the memory-mapped file
+        self.misses += 1
+        x0 = tile_x*self.tile_size
+        y0 = tile_y*self.tile_size
+        tile = np.array(self.data[x0:x0 + self.tile_size, y0:y0 + self.tile_size])
+
+        # Evicts the least recently used tile
+        self.tiles[key] = tile
+        if len(self.tiles) > self.max_tiles:
+            self.tiles.popitem(last=False)
+
+        return tile
+
+    def gather(self, xi, yi):
+        """Reads many pixels at once, grouped by tile.
+
+        Args:
+            xi, yi (np.ndarray): pixel indices in the map.
+
+        Returns:
+            np.ndarray: pixel intensities, same shape as xi and yi.
+        """
+
+        xi, yi = np.broadcast_arrays(np.asarray(xi, dtype=int), np.asarray(yi, dtype=int))
+        values = np.full(xi.shape, self.outside_value, dtype=float)
+
+        inside = (xi >= 0) & (xi < self.width_pixels) & (yi >= 0) & (yi < self.height_pixels)
+        xs = xi[inside]
+        ys = yi[inside]
+
+        # Sorts the points by tile, so that each tile reads one contiguous slice of them
+        tiles_y_number = -(-self.height_pixels//self.tile_size)
+        keys = (xs//self.tile_size)*tiles_y_number + ys//self.tile_size
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        bounds = np.flatnonzero(np.diff(keys)) + 1
+
+        read = np.empty(xs.shape, dtype=float)
+        for first, last in zip(np.concatenate(([0], bounds)), np.concatenate((bounds, [len(keys)]))):
+            if first == last:
+                continue
+            tile_x, tile_y = divmod(int(keys[first]), tiles_y_number)
+            selected = order[first:last]
+            tile = self.get_tile(tile_x, tile_y)
+            read[selected] = tile[xs[selected] - tile_x*self.tile_size,
+                                  ys[selected] - tile_y*self.tile_size]
+
+        values[inside] = read
+        return values
+
+    def sample(self, x, y, bilinear=False):
+        """Samples the map at many world positions at once.
+
+        Args:
+            x, y (np.ndarray): sample positions, in meters.
+            bilinear (bool, optional): interpolates between the four closest pixels. \
+                Defaults to False.
+
+        Returns:
+            np.ndarray: sampled intensities (0 to 255), with the broadcast shape of x and y.
+        """
+
+        px = np.asarray(x, dtype=float)*self.meters_to_pixels
+        py = np.asarray(y, dtype=float)*self.meters_to_pixels
+
+        if not bilinear:
+            return self.gather(np.floor(px), np.floor(py))
+
+        # Pixel i covers [i, i + 1), so its center is at i + 0.5 (see utils.sample_grayscale)
+        px = px - 0.5
+        py = py - 0.5
+        x0 = np.floor(px)
+        y0 = np.floor(py)
+        wx = px - x0
+        wy = py - y0
+
+        top = self.gather(x0, y0)*(1 - wx) + self.gather(x0 + 1, y0)*wx
+        bottom = self.gather(x0, y0 + 1)*(1 - wx) + self.gather(x0 + 1, y0 + 1)*wx
+
+        return top*(1 - wy) + bottom*wy
+
+    def viewport(self, center, size, meters_to_screen):
+        """Samples the rectangle of the map shown in a window centered at a world position.
+
+        Only the tiles under the viewport are loaded. The window columns and rows falling
+        in each tile are copied from it with a single index array. When the viewport covers
+        more tiles than the cache holds, or skips more map pixels per window column than a
+        tile is wide (zoomed out), the pixels are read straight from the file instead, and
+        the cache is left alone.
+
+        Args:
+            center (tuple): viewport center (x, y), in meters.
+            size (tuple): viewport size (width, height), in screen pixels.
+            meters_to_screen (float): display scale, in screen pixels per meter.
+
+        Returns:
+            np.ndarray: intensities of the viewport, shape (width, height).
+        """
+
+        width, height = size
+        xs = center[0] + (np.arange(width) - width/2)/meters_to_screen
+        ys = center[1] + (np.arange(height) - height/2)/meters_to_screen
+
+        # Map pixel under each window column and row (increasing)
+        xi = np.floor(xs*self.meters_to_pixels).astype(int)
+        yi = np.floor(ys*self.meters_to_pixels).astype(int)
+
+        view = np.full((width, height), self.outside_value, dtype=np.uint8)
+
+        # Window columns and rows covered by each tile column and row inside the map
+        columns = self.tile_spans(xi, self.width_pixels)
+        rows = self.tile_spans(yi, self.height_pixels)
+
+        if len(columns)*len(rows) > self.max_tiles or self.meters_to_pixels/meters_to_screen > self.tile_size:
+            window_columns = np.flatnonzero((xi >= 0) & (xi < self.width_pixels))
+            window_rows = np.flatnonzero((yi >= 0) & (yi < self.height_pixels))
+            view[np.ix_(window_columns, window_rows)] = self.data[np.ix_(xi[window_columns], yi[window_rows])]
+            return view
+
+        for tile_x, first_column, last_column in columns:
+            for tile_y, first_row, last_row in rows:
+                tile = self.get_tile(tile_x, tile_y)
+                view[first_column:last_column, first_row:last_row] = tile[np.ix_(
+                    xi[first_column:last_column] - tile_x*self.tile_size,
+                    yi[first_row:last_row] - tile_y*self.tile_size)]
+
+        return view
+
+    def tile_spans(self, indices, size):
+        """Splits increasing pixel indices by tile.
+
+        Args:
+            indices (np.ndarray): increasing pixel indices along one axis.
+            size (int): map size along that axis, in pixels.
+
+        Returns:
+            list: (tile index, first position, last position + 1) for each tile covered \
+                by the indices inside the map.
+        """
+
+        inside = np.flatnonzero((indices >= 0) & (indices < size))
+        if len(inside) == 0:
+            return []
+
+        first, last = inside[0], inside[-1] + 1
+        tiles = indices[first:last]//self.tile_size
+        bounds = np.flatnonzero(np.diff(tiles)) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [len(tiles)]))
+
+        return [(int(tiles[start]), first + start, first + end) for start, end in zip(starts, ends)]
@@ -0,0 +1,203 @@
+import multiprocessing
+import os
+
+import numpy as np
+
+import kernel
+
+# Arena and robot set by the parent of the tuner worker processes
+_SETUP_INFO = None
+_MAP_ARRAY = None
+
+# Added to the cost of candidates that leave the map or are terminated early
+FAILURE_PENALTY = 100.0
+
+# Time term of candidates that stay on the map without completing a lap
+NO_LAP_TIME = 2.0
+
+
+
+# +===========================================================================+
+# |                                 Objective                                 |
+# +===========================================================================+
+
+def evaluate(setup_info, map_array, candidates, dt=0.01, steps=5000, segment=500,
+             max_error_rms=0.8, error_weight=1.0, backend='auto', lap_radius=20):
+    """Simulates a batch of candidates together and returns their costs (lower is better).
+
+    The cost is the mean lap time relative to the simulated time (steps*dt) plus \
+    error_weight times the RMS controller error (the deviation from the line). Laps \
+    are counted when the robot comes back to its start position (see \
+    StepKernel.mean_lap_time), so steps must cover at least one lap; candidates that \
+    complete none get a time term of NO_LAP_TIME. Candidates that leave the map, or \
+    whose RMS error is above max_error_rms after a segment, stop being simulated and \
+    get FAILURE_PENALTY, more for earlier failures.
+
+    Args:
+        setup_info (tuple): robot parameters, as returned by utils.read_setup_file.
+        map_array (np.ndarray): arena grayscale array.
+        candidates (np.ndarray): one row per candidate: kp, ki, kd, and optionally the \
+            sensor positions (x, y) relative to the robot, flattened.
+        dt (float, optional): time step, in seconds. Defaults to 0.01.
+        steps (int, optional): number of steps of each simulation. Defaults to 5000.
+        segment (int, optional): steps between early termination checks. Defaults to 500.
+        max_error_rms (float, optional): RMS error that terminates a candidate. Defaults to 0.8.
+        error_weight (float, optional): weight of the RMS error in the cost. Defaults to 1.0.
+        backend (str, optional): StepKernel backend. Defaults to 'auto'.
+        lap_radius (float, optional): distance to the start that closes a lap, in the \
+            map's unit. Defaults to 20.
+
+    Returns:
+        np.ndarray: cost of each candidate.
+    """
+
+    candidates = np.atleast_2d(candidates)
+    sensors_relative_positions = None
+    if candidates.shape[1] > 3:
+        sensors_relative_positions = candidates[:, 3:].reshape(len(candidates), -1, 2)
+
+    step_kernel = kernel.StepKernel(setup_info, map_array, candidates[:, 0], candidates[:, 1], candidates[:, 2],
+                                    sensors_relative_positions=sensors_relative_positions, backend=backend,
+                                    lap_radius=lap_radius)
+    terminated = np.zeros(len(candidates), dtype=bool)
+
+    done = 0
+    while done < steps and not step_kernel.off_map.all():
+        step_kernel.run(min(segment, steps - done), dt)
+        done += segment
+
+        # Early termination: failing candidates are frozen like the ones off the map
+        failing = ~step_kernel.off_map & (step_kernel.error_rms() > max_error_rms)
+        terminated |= failing
+        step_kernel.off_map |= failing
+
+    # Lap time relative to the simulated time
+    relative_time = step_kernel.mean_lap_time(dt)/(steps*dt)
+    relative_time[step_kernel.laps == 0] = NO_LAP_TIME
+
+    costs = relative_time + error_weight*step_kernel.error_rms()
+
+    failed = step_kernel.off_map | terminated
+    costs[failed] += FAILURE_PENALTY*(2 - step_kernel.steps[failed]/steps)
+
+    return costs
+
+def _init_worker(setup_info, map_array):
+    """Receives the arena and the robot setup in a tuner worker process."""
+
+    global _SETUP_INFO, _MAP_ARRAY
+    _SETUP_INFO = setup_info
+    _MAP_ARRAY = map_array
+
+def _evaluate_chunk(candidates, options):
+    """Evaluates part of a generation in a tuner worker process."""
+
+    return evaluate(_SETUP_INFO, _MAP_ARRAY, candidates, **options)
+
+
+
+# +===========================================================================+
+# |                           Differential evolution                          |
+# +===========================================================================+
+
+def gain_bounds(kp=(0, 200), ki=(0, 20), kd=(0, 1)):
+    """Returns the search bounds of the PID gains.
+
+    Args:
+        kp, ki, kd (tuple, optional): (lower, upper) bounds of each gain.
+
+    Returns:
+        np.ndarray: bounds, shape (3, 2).
+    """
+
+    return np.array([kp, ki, kd], dtype=float)
+
+def sensor_bounds(setup_info, margin=10):
+    """Returns search bounds that let each sensor move around its setup position.
+
+    Args:
+        setup_info (tuple): robot parameters, as returned by utils.read_setup_file.
+        margin (float, optional): maximum displacement of each coordinate. Defaults to 10.
+
+    Returns:
+        np.ndarray: bounds of the flattened sensor positions, shape (2*sensors, 2).
+    """
+
+    positions = np.asarray(setup_info[7], dtype=float).ravel()
+
+    return np.stack((positions - margin, positions + margin), axis=1)
+
+def tune(setup_info, map_array, bounds, population_size=32, generations=30,
+         mutation=0.7, crossover=0.9, workers=None, seed=None, callback=None, **options):
+    """Searches the controller parameters with the lowest cost using differential evolution.
+
+    Each generation is evaluated as one batch, split between the worker processes.
+
+    Args:
+        setup_info (tuple): robot parameters, as returned by utils.read_setup_file.
+        map_array (np.ndarray): arena grayscale array.
+        bounds (np.ndarray): (lower, upper) bounds of each parameter: the gains \
+            (see gain_bounds), optionally followed by the sensor positions (see sensor_bounds).
+        population_size (int, optional): candidates per generation, at least 4. Defaults to 32.
+        generations (int, optional): number of generations. Defaults to 30.
+        mutation (float, optional): differential weight. Defaults to 0.7.
+        crossover (float, optional): crossover probability. Defaults to 0.9.
+        workers (int, optional): worker processes. Defaults to the number of cores.
+        seed (int, optional): random seed. Defaults to None.
+        callback (callable, optional): called after each generation as \
+            callback(generation, best_parameters, best_cost).
+        **options: passed to evaluate (dt, steps, segment, max_error_rms, error_weight, backend, \
+            lap_radius).
+
+    Returns:
+        np.ndarray: best parameters found.
+        float: their cost.
+    """
+
+    # Each mutant is built from three candidates other than its target
+    if population_size < 4:
+        raise ValueError(f"The population needs at least 4 candidates, got {population_size}.")
+
+    rng = np.random.default_rng(seed)
+    bounds = np.asarray(bounds, dtype=float)
+    lower, upper = bounds[:, 0], bounds[:, 1]
+    dimensions = len(bounds)
+    workers = workers or os.cpu_count()
+
+    population = lower + rng.random((population_size, dimensions))*(upper - lower)
+
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(setup_info, map_array)) as pool:
+
+        def evaluate_batch(candidates):
+            chunks = [chunk for chunk in np.array_split(candidates, workers) if len(chunk)]
+            return np.concatenate(pool.starmap(_evaluate_chunk, [(chunk, options) for chunk in chunks]))
+
+        costs = evaluate_batch(population)
+
+        for generation in range(generations):
+
+            # Mutation (rand/1): three distinct candidates other than the target
+            others = np.array([rng.choice(np.delete(np.arange(population_size), idx), 3, replace=False)
+                               for idx in range(population_size)])
+            mutants = (population[others[:, 0]] +
+                       mutation*(population[others[:, 1]] - population[others[:, 2]]))
+            mutants = np.clip(mutants, lower, upper)
+
+            # Binomial crossover, keeping at least one parameter of the mutant
+            cross = rng.random((population_size, dimensions)) < crossover
+            cross[np.arange(population_size), rng.integers(dimensions, size=population_size)] = True
+            trials = np.where(cross, mutants, population)
+
+            # Selection
+            trial_costs = evaluate_batch(trials)
+            better = trial_costs <= costs
+            population[better] = trials[better]
+            costs[better] = trial_costs[better]
+
+            if callback is not None:
+                best = np.argmin(costs)
+                callback(generation, population[best], costs[best])
+
+    best = np.argmin(costs)
+
+    return population[best], costs[best]
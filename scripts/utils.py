@@ -29,6 +29,39 @@ def PID(kp, ki, kd, I,
  
     return P + D + I, I
 
+def import_pygame():
+    """Imports pygame on first use, without printing its support banner.
+    
+    Modules that only render import pygame through this function, so that simulations \
+    without a window never load it.
+    
+    Returns:
+        module: pygame.
+    """
+    
+    os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+    import pygame
+    
+    return pygame
+
+class LazyModule:
+    """Stands for a module that is only imported when one of its attributes is first used."""
+    
+    def __init__(self, importer):
+        """LazyModule class constructor.
+        
+        Args:
+            importer (callable): returns the module (e.g. import_pygame).
+        """
+        
+        self._importer = importer
+        self._module = None
+    
+    def __getattr__(self, name):
+        if self._module is None:
+            self._module = self._importer()
+        return getattr(self._module, name)
+
 def rotate_vector(vector, angle):
     """Rotates a vector in an angle.
     
@@ -49,6 +82,140 @@ def rotate_vector(vector, angle):
     
     return rotated_vector
 
+def rotate_vectors(vectors, angle):
+    """Rotates an array of vectors in the same angle.
+    
+    Args:
+        vectors (np.ndarray): vectors to be rotated, shape (n, 2).
+        angle (float): rotation angle, in radians.
+        
+    Returns:
+        np.ndarray: rotated vectors, shape (n, 2).
+    """
+    
+    # Rotation matrix
+    rotation_matrix = np.array([[np.cos(angle), -np.sin(angle)],
+                                [np.sin(angle), np.cos(angle)]])
+    
+    # Each row is a vector, so the rotation matrix is applied transposed
+    return np.asarray(vectors, dtype=float).dot(rotation_matrix.T)
+
+def sensors_positions(sensors_relative_positions, robot_position):
+    """Computes the positions of many sensors at once, as Sensor.update_position does for one.
+    
+    Args:
+        sensors_relative_positions (np.ndarray): sensor positions relative to the robot, shape (n, 2).
+        robot_position (tuple): robot current position (x, y, heading).
+        
+    Returns:
+        np.ndarray: sensors horizontal positions, shape (n,).
+        np.ndarray: sensors vertical positions, shape (n,).
+    """
+    
+    rotated = rotate_vectors(sensors_relative_positions, robot_position[2])
+    
+    return robot_position[0] + rotated[:, 0], robot_position[1] - rotated[:, 1] # y-axis is inverted
+
+def is_outside(x, y, width, height):
+    """Checks if any of the given points is outside the arena limits.
+    
+    Args:
+        x, y (float or np.ndarray): positions to be checked.
+        width, height (float): arena dimensions.
+        
+    Returns:
+        bool: True if any point is outside, False otherwise.
+    """
+    
+    return bool(np.any(x < 0) or np.any(x > width) or np.any(y < 0) or np.any(y > height))
+
+def surface_to_grayscale(surface):
+    """Converts a pygame surface into a grayscale array, indexed as [x, y].
+    
+    Args:
+        surface (pygame.Surface): image to be converted.
+        
+    Returns:
+        np.ndarray: grayscale intensities (0 to 255), shape (width, height).
+    """
+    
+    pygame = import_pygame()
+    
+    # Average of the RGB values of each pixel, as in is_darker
+    return pygame.surfarray.array3d(surface).mean(axis=2)
+
+def load_map_array(map_image_path, map_dimensions, cache=True):
+    """Loads the arena image as a grayscale array, without opening a window.
+    
+    The decoded array is cached next to the image (e.g. map.png.1336x668.npy), so that \
+    later loads need neither pygame nor image decoding.
+    
+    Args:
+        map_image_path (str): arena image path.
+        map_dimensions (tuple): dimensions (width, height) the map is scaled to, in pixels.
+        cache (bool, optional): reads and writes the cached array. Defaults to True.
+        
+    Returns:
+        np.ndarray: grayscale intensities (0 to 255), shape (width, height).
+    """
+    
+    cache_path = f"{map_image_path}.{map_dimensions[0]}x{map_dimensions[1]}.npy"
+    
+    # The cache is only valid if it is newer than the image
+    if (cache and os.path.isfile(cache_path) and
+        os.path.getmtime(cache_path) >= os.path.getmtime(map_image_path)):
+        return np.load(cache_path)
+    
+    pygame = import_pygame()
+    
+    map_image = pygame.transform.scale(pygame.image.load(map_image_path), map_dimensions)
+    map_array = surface_to_grayscale(map_image)
+    
+    if cache:
+        np.save(cache_path, map_array)
+    
+    return map_array
+
+def sample_grayscale(gray, x, y, bilinear=False):
+    """Samples a grayscale array at many points at once.
+    
+    Points outside the array are clamped to its border.
+    
+    Args:
+        gray (np.ndarray): grayscale intensities, shape (width, height).
+        x, y (np.ndarray): sample coordinates, in pixels.
+        bilinear (bool, optional): interpolates between the four closest pixels \
+            instead of truncating to the nearest one below. Defaults to False.
+        
+    Returns:
+        np.ndarray: sampled intensities, same shape as x and y.
+    """
+    
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    width, height = gray.shape
+    
+    if not bilinear:
+        # Same truncation as int() in Sensor.read_data
+        xi = np.clip(x.astype(int), 0, width - 1)
+        yi = np.clip(y.astype(int), 0, height - 1)
+        return gray[xi, yi]
+    
+    # Pixel i covers [i, i + 1), as in the truncation above, so its center is at i + 0.5
+    x = np.clip(x - 0.5, 0, width - 1)
+    y = np.clip(y - 0.5, 0, height - 1)
+    x0 = np.floor(x).astype(int)
+    y0 = np.floor(y).astype(int)
+    x1 = np.minimum(x0 + 1, width - 1)
+    y1 = np.minimum(y0 + 1, height - 1)
+    wx = x - x0
+    wy = y - y0
+    
+    top = gray[x0, y0]*(1 - wx) + gray[x1, y0]*wx
+    bottom = gray[x0, y1]*(1 - wx) + gray[x1, y1]*wx
+    
+    return top*(1 - wy) + bottom*wy
+
 def is_darker(color1, color2):
     """Checks if color1 is darker than color2.
     
@@ -0,0 +1,36 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# The simulator modules live in scripts/ and import each other by name
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+
+@pytest.fixture
+def ring_map():
+    """800x800 grayscale arena with a dark ring of radius 250 and width 60 around its center."""
+
+    x, y = np.meshgrid(np.arange(800) + 0.5, np.arange(800) + 0.5, indexing='ij')
+    distance = np.hypot(x - 400, y - 400)
+
+    return np.where(np.abs(distance - 250) < 30, 0, 255).astype(np.uint8)
+
+
+@pytest.fixture
+def setup_info():
+    """Robot setup in the format of utils.read_setup_file, starting on the ring heading up."""
+
+    return (0.1, 10000, 20000, 0.04, 5, (800, 800), (650, 400, np.pi/2),
+            [[36.0, 41.0], [36.0, 21.0], [37.0, 2.0], [37.0, -20.0], [37.0, -40.0]], None)
+
+
+@pytest.fixture
+def python_loops(monkeypatch):
+    """Runs the 'numba' backend of the step kernel with kernel._run_loops uncompiled, even without Numba."""
+
+    import kernel
+
+    monkeypatch.setattr(kernel, 'numba', kernel.numba or 'uncompiled')
+    monkeypatch.setattr(kernel, '_run_compiled', kernel._run_loops)
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from analytics import RunningStats, TrajectoryAnalytics
+import simulation
+
+
+def test_running_stats_match_numpy():
+    values = np.random.default_rng(0).normal(3, 2, 1000)
+    stats = RunningStats()
+    for value in values:
+        stats.update(value)
+
+    assert stats.mean == pytest.approx(values.mean())
+    assert stats.std == pytest.approx(values.std())
+    assert stats.rms == pytest.approx(np.sqrt(np.mean(values**2)))
+
+
+@pytest.mark.parametrize('saturation, expected', [(1.0, 0.5), (0.5, 0.75)])
+def test_saturation_counts_large_corrections(saturation, expected):
+    analytics = TrajectoryAnalytics((0, 0, 0), saturation=saturation)
+    for pid in [0, 500, 1000, -1500]:
+        analytics.update(0.01, 0, 0, [1, 1], 0, pid, max_motor_speed=1000)
+
+    assert analytics.row()['saturation'] == expected
+
+
+def test_saturation_depends_on_the_gains(setup_info, ring_map):
+    rows = []
+    for kp in [50, 30000]:
+        analytics = TrajectoryAnalytics(setup_info[6])
+        simulation.simulate(setup_info, ring_map, kp=kp, ki=0, kd=0, steps=500, analytics=analytics)
+        rows.append(analytics.row())
+
+    assert rows[0]['saturation'] == 0
+    assert rows[1]['saturation'] > 0
@@ -0,0 +1,54 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from arena import Arena
+from classes import Robot
+import simulation
+
+
+def make_robot(setup_info, position=None, width=None):
+    (ROBOT_WIDTH, INITIAL_MOTOR_SPEED, MAX_MOTOR_SPEED, WHEEL_RADIUS,
+     SENSORS_NUMBER, MAP_DIMENSIONS, ROBOT_START, SENSORS_POSITIONS, _) = setup_info
+    position = ROBOT_START if position is None else position
+
+    robot = Robot(position, ROBOT_WIDTH if width is None else width,
+                  INITIAL_MOTOR_SPEED, MAX_MOTOR_SPEED, WHEEL_RADIUS)
+    for sensor_position in SENSORS_POSITIONS:
+        robot.add_sensor(sensor_position, position)
+
+    return robot
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_candidate_pairs_include_every_overlap(setup_info, seed):
+    rng = np.random.default_rng(seed)
+    arena = Arena(meters_to_units=100)
+
+    # Mixed widths (5 to 30 units), added in random order so the grid is rebuilt on the way
+    for x, y, width in zip(rng.uniform(-50, 250, 300), rng.uniform(-50, 250, 300), rng.uniform(0.05, 0.3, 300)):
+        arena.add_robot(make_robot(setup_info, (x, y, 0), width), gains=None)
+
+    overlaps = {(a, b) for a, b in itertools.combinations(range(len(arena.robots)), 2)
+                if np.hypot(arena.robots[a].x - arena.robots[b].x, arena.robots[a].y - arena.robots[b].y) <
+                (arena.robots[a].width + arena.robots[b].width)*100/2}
+    pairs = [tuple(sorted(pair)) for pair in arena.grid.candidate_pairs()]
+
+    assert overlaps
+    assert len(pairs) == len(set(pairs))
+    assert overlaps <= set(pairs)
+
+
+def test_single_robot_follows_simulate(setup_info, ring_map):
+    expected = simulation.simulate(setup_info, ring_map, kp=50, ki=3, kd=0.01, steps=3000, record=True)
+
+    arena = Arena(ring_map, meters_to_units=1200)
+    arena.add_robot(make_robot(setup_info), gains=(50, 3, 0.01))
+    trajectory = []
+    for _ in range(3000):
+        arena.step(0.01)
+        robot = arena.robots[0]
+        trajectory.append((robot.x, robot.y, robot.heading))
+
+    np.testing.assert_array_equal(trajectory, expected['trajectory'])
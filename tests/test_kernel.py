@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+import kernel
+import simulation
+
+# Line followers (some of them oscillating) and a robot that drives straight off the map
+GAINS = [(50, 3, 0.01), (10, 0, 0), (100, 5, 0.1), (0, 0, 0)]
+DT = 0.01
+STEPS = 2000
+
+
+def run_kernel(setup_info, ring_map, backend):
+    kp, ki, kd = np.asarray(GAINS, dtype=float).T
+    step_kernel = kernel.StepKernel(setup_info, ring_map, kp, ki, kd, backend=backend)
+    step_kernel.run(STEPS, DT)
+
+    return step_kernel.results(DT)
+
+
+def assert_same_results(results, expected):
+    for result, reference in zip(results, expected):
+        assert result['steps'] == reference['steps']
+        assert result['off_map'] == reference['off_map']
+        np.testing.assert_allclose([result['x'], result['y'], result['heading']],
+                                   [reference['x'], reference['y'], reference['heading']], rtol=0, atol=1e-9)
+
+
+@pytest.fixture
+def expected(setup_info, ring_map):
+    return [simulation.simulate(setup_info, ring_map, kp, ki, kd, dt=DT, steps=STEPS) for kp, ki, kd in GAINS]
+
+
+def test_reference_runs(expected):
+    # The gains cover both outcomes: following the ring to the end and leaving the map
+    assert [result['off_map'] for result in expected] == [False, False, False, True]
+    assert expected[0]['steps'] == STEPS and expected[3]['steps'] < STEPS
+
+
+def test_numpy_backend_matches_simulate(setup_info, ring_map, expected):
+    assert_same_results(run_kernel(setup_info, ring_map, 'numpy'), expected)
+
+
+def test_numba_backend_matches_simulate(setup_info, ring_map, expected):
+    pytest.importorskip('numba')
+    assert_same_results(run_kernel(setup_info, ring_map, 'numba'), expected)
+
+
+def test_python_loops_match_simulate(setup_info, ring_map, expected, python_loops):
+    # The loops compiled by the 'numba' backend, run as plain Python
+    assert_same_results(run_kernel(setup_info, ring_map, 'numba'), expected)
+
+
+def test_runs_in_segments_match_one_run(setup_info, ring_map):
+    kp, ki, kd = np.asarray(GAINS, dtype=float).T
+    step_kernel = kernel.StepKernel(setup_info, ring_map, kp, ki, kd, backend='numpy')
+    for _ in range(STEPS//500):
+        step_kernel.run(500, DT)
+
+    assert step_kernel.results(DT) == run_kernel(setup_info, ring_map, 'numpy')
+
+
+def test_check_backends_agree(setup_info, ring_map):
+    assert kernel.check_backends(setup_info, ring_map, GAINS, dt=DT, steps=STEPS) == []
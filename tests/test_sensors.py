@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from classes import LineScanSensor, Sensor
+
+
+@pytest.fixture
+def noise_map():
+    """Random grayscale arena, so that neighbouring pixels differ."""
+
+    return np.random.default_rng(0).integers(0, 256, (400, 300)).astype(float)
+
+
+@pytest.mark.parametrize('robot_position', [(650, 400, np.pi/2), (400, 150, 0.3), (155.7, 400.2, -1.6)])
+def test_line_scan_matches_point_sensors(ring_map, robot_position):
+    line_scan = LineScanSensor((36, 45), (37, -45), 31, robot_position)
+    readings = line_scan.read_data(ring_map)
+
+    # A point sensor at every point of the strip
+    expected = []
+    for relative_position in line_scan.relative_positions:
+        sensor = Sensor(relative_position, robot_position)
+        sensor.read_data(ring_map)
+        expected.append(sensor.data)
+
+    assert readings.tolist() == expected
+
+    # The strip crosses the line
+    assert 0 < readings.sum() < len(readings)
+
+
+def test_bilinear_matches_nearest_at_pixel_centers(noise_map):
+    # Heading 0: the strip points fall on pixel centers (i + 0.5, j + 0.5)
+    robot_position = (200.5, 150.5, 0)
+    nearest = LineScanSensor((10, -40), (10, 40), 81, robot_position)
+    bilinear = LineScanSensor((10, -40), (10, 40), 81, robot_position, bilinear=True)
+    nearest.read_data(noise_map)
+    bilinear.read_data(noise_map)
+
+    np.testing.assert_allclose(bilinear.intensity, nearest.intensity, rtol=0, atol=1e-9)
+    np.testing.assert_array_equal(nearest.intensity, noise_map[210, 190:109:-1])
+
+
+def test_single_point_strip(ring_map):
+    robot_position = (650, 400, np.pi/2)
+    line_scan = LineScanSensor((37, 2), (37, -40), 1, robot_position)
+    sensor = Sensor((37, 2), robot_position)
+    sensor.read_data(ring_map)
+
+    assert line_scan.read_data(ring_map).tolist() == [sensor.data]
+    assert (line_scan.x[0], line_scan.y[0]) == pytest.approx((sensor.x, sensor.y))
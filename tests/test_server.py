@@ -0,0 +1,93 @@
+import asyncio
+
+import numpy as np
+
+import server
+from server import Session, SimulationClient, SimulationServer
+
+
+def run_with_server(simulation_server, client_code):
+    """Serves simulation_server on a free local port while client_code(port) runs."""
+
+    async def main():
+        listener = await asyncio.start_server(simulation_server.handle, '127.0.0.1', 0)
+        async with listener:
+            return await client_code(listener.sockets[0].getsockname()[1])
+
+    return asyncio.run(main())
+
+
+def test_lockstep_telemetry(setup_info, ring_map):
+    simulation_server = SimulationServer(ring_map, setup_info, dt=0.01)
+
+    async def client_code(port):
+        client = await SimulationClient.connect(port=port)
+        records = await client.command(10000, 12000, steps=5)
+        await client.close()
+        return client, records
+
+    client, records = run_with_server(simulation_server, client_code)
+
+    # The same steps run locally
+    session = Session(ring_map, setup_info, 0.01)
+    session.set_command(10000, 12000)
+    expected = np.frombuffer(b''.join(session.step() for _ in range(5)),
+                             dtype=server.telemetry_dtype(session.sensors_number))
+
+    assert (client.mode, client.sensors_number) == ('lockstep', 5)
+    assert client.dt == np.float32(0.01)
+    np.testing.assert_array_equal(records, expected)
+    assert records['step'].tolist() == [1, 2, 3, 4, 5]
+
+
+def test_steps_are_capped(setup_info, ring_map, monkeypatch):
+    monkeypatch.setattr(server, 'MAX_STEPS', 20)
+    monkeypatch.setattr(server, 'CHUNK_STEPS', 7)
+    simulation_server = SimulationServer(ring_map, setup_info)
+
+    async def client_code(port):
+        client = await SimulationClient.connect(port=port)
+        records = await client.command(10000, 10000, steps=4_000_000_000)
+        await client.close()
+        return records
+
+    records = run_with_server(simulation_server, client_code)
+
+    assert records['step'].tolist() == list(range(1, 21))
+
+
+def test_malformed_command_closes_the_session(setup_info, ring_map):
+    simulation_server = SimulationServer(ring_map, setup_info)
+
+    async def client_code(port):
+        client = await SimulationClient.connect(port=port)
+        assert len(simulation_server.sessions) == 1
+
+        server.write_frame(client.writer, server.MSG_COMMAND, b'\x00\x01')
+        await client.writer.drain()
+
+        # The server closes the connection without answering
+        closed = await asyncio.wait_for(client.reader.read(), timeout=5)
+        client.writer.close()
+        return closed
+
+    assert run_with_server(simulation_server, client_code) == b''
+    assert len(simulation_server.sessions) == 0
+
+
+def test_free_running_batch(setup_info, ring_map):
+    simulation_server = SimulationServer(ring_map, setup_info, mode='free-running', batch_size=10)
+
+    async def client_code(port):
+        client = await SimulationClient.connect(port=port)
+        assert await client.command(10000, 10000) is None
+        records = await client.telemetry()
+        await client.close()
+        return client, records
+
+    client, records = run_with_server(simulation_server, client_code)
+
+    assert client.mode == 'free-running'
+    assert len(records) == 10
+    assert np.all(np.diff(records['step']) == 1)
+    assert records['sensors'].shape == (10, 5)
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from tilemap import TiledMap
+
+
+@pytest.fixture
+def tiled_map(tmp_path):
+    """3 m x 2 m map at 100 px/m in 32 px tiles, with a cache of 8 tiles."""
+
+    path = str(tmp_path / 'map.npy')
+    np.save(path, np.random.default_rng(0).integers(0, 256, (300, 200), dtype=np.uint8))
+
+    return TiledMap(path, meters_to_pixels=100, tile_size=32, max_tiles=8)
+
+
+def expected_viewport(tiled_map, center, size, meters_to_screen):
+    xs = center[0] + (np.arange(size[0]) - size[0]/2)/meters_to_screen
+    ys = center[1] + (np.arange(size[1]) - size[1]/2)/meters_to_screen
+
+    return tiled_map.sample(xs[:, np.newaxis], ys[np.newaxis, :])
+
+
+@pytest.mark.parametrize('center, meters_to_screen', [
+    ((1.5, 1.0), 400),  # a few tiles, read through the cache
+    ((1.5, 1.0), 100),  # more tiles than the cache holds
+    ((0.2, 1.9), 2),    # zoomed out, mostly outside the map
+])
+def test_viewport_matches_sample(tiled_map, center, meters_to_screen):
+    view = tiled_map.viewport(center, (120, 80), meters_to_screen)
+
+    np.testing.assert_array_equal(view, expected_viewport(tiled_map, center, (120, 80), meters_to_screen))
+
+
+def test_viewport_keeps_the_cache_limit(tiled_map):
+    # The whole map (70 tiles) in one frame is read from the file, without filling the cache
+    tiled_map.viewport((1.5, 1.0), (300, 200), 100)
+    assert tiled_map.max_tiles == 8
+    assert len(tiled_map.tiles) == 0
+
+    # A frame that fits in the cache is served from it the second time
+    tiled_map.viewport((1.5, 1.0), (40, 40), 100)
+    misses = tiled_map.misses
+    tiled_map.viewport((1.5, 1.0), (40, 40), 100)
+    assert tiled_map.misses == misses
+    assert len(tiled_map.tiles) <= 8
+
+
+@pytest.mark.parametrize('channels', [None, 3])
+def test_from_array_converts_strip_by_strip(tmp_path, channels):
+    shape = (50, 40) if channels is None else (50, 40, channels)
+    source = np.random.default_rng(1).integers(0, 256, shape, dtype=np.uint8)
+    np.save(tmp_path / 'source.npy', source)
+
+    tiled_map = TiledMap.from_array(str(tmp_path / 'source.npy'), str(tmp_path / 'map.npy'),
+                                    meters_to_pixels=100, scale=3)
+
+    gray = source if channels is None else source.astype(float).mean(axis=2).astype(np.uint8)
+    np.testing.assert_array_equal(tiled_map.data, gray.repeat(3, axis=0).repeat(3, axis=1))
+    assert (tiled_map.width, tiled_map.height) == (1.5, 1.2)
@@ -0,0 +1,83 @@
+import csv
+
+import numpy as np
+import pytest
+
+from analytics import TrajectoryAnalytics
+import cli
+import kernel
+import simulation
+import tuner
+import utils
+
+# Gains that all follow the ring, at slightly different lap times
+GAINS = [(50, 3, 0.01), (10, 0, 0), (400, 0, 0)]
+
+
+@pytest.mark.parametrize('backend', ['numpy', 'numba', 'python loops'])
+def test_laps_match_trajectory_analytics(setup_info, ring_map, backend, request):
+    if backend == 'numba':
+        pytest.importorskip('numba')
+    if backend == 'python loops':
+        request.getfixturevalue('python_loops')
+        backend = 'numba'
+
+    kp, ki, kd = np.asarray(GAINS, dtype=float).T
+    step_kernel = kernel.StepKernel(setup_info, ring_map, kp, ki, kd, backend=backend)
+    step_kernel.run(5000, 0.01)
+
+    for idx, (kp, ki, kd) in enumerate(GAINS):
+        analytics = TrajectoryAnalytics(setup_info[6])
+        simulation.simulate(setup_info, ring_map, kp, ki, kd, steps=5000, analytics=analytics)
+        row = analytics.row()
+
+        assert row['laps'] == step_kernel.laps[idx] > 0
+        assert row['mean_lap_time'] == pytest.approx(step_kernel.mean_lap_time(0.01)[idx])
+
+
+def test_tune_improves_on_the_initial_population(setup_info, ring_map):
+    options = dict(bounds=tuner.gain_bounds(), population_size=8, workers=2, seed=3,
+                   steps=2500, backend='numpy')
+
+    # Without generations, tune returns the best candidate of the initial population
+    _, initial_cost = tuner.tune(setup_info, ring_map, generations=0, **options)
+
+    generations = []
+    parameters, cost = tuner.tune(setup_info, ring_map, generations=4,
+                                  callback=lambda *best: generations.append(best), **options)
+
+    assert cost < initial_cost
+    assert [generation for generation, _, _ in generations] == [0, 1, 2, 3]
+    assert cost == generations[-1][2]
+    assert np.all((parameters >= options['bounds'][:, 0]) & (parameters <= options['bounds'][:, 1]))
+
+
+def test_tune_needs_four_candidates(setup_info, ring_map):
+    with pytest.raises(ValueError):
+        tuner.tune(setup_info, ring_map, tuner.gain_bounds(), population_size=3, workers=1)
+
+    with pytest.raises(SystemExit):
+        cli.build_parser().parse_args(['tune', '--population', '3'])
+
+
+def test_results_include_the_sensor_positions(setup_info, ring_map, tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, 'read_setup_file', lambda: setup_info)
+    monkeypatch.setattr(utils, 'load_map_array', lambda path, dimensions: ring_map)
+    results = tmp_path / 'tuning.csv'
+
+    cli.main(['tune', '--sensors', '--population', '4', '--generations', '1', '--workers', '1',
+              '--steps', '500', '--backend', 'numpy', '--results', str(results)])
+
+    with open(results) as file:
+        row = next(csv.DictReader(file))
+    assert [key for key in row if key.startswith('sensor_')] == [
+        f'sensor_{idx}_{axis}' for idx in range(5) for axis in 'xy']
+    assert abs(float(row['sensor_0_x']) - 36) <= 10
+
+
+def test_no_lap_is_worse_than_any_lap(setup_info, ring_map):
+    # 15 s is shorter than a lap of the ring
+    costs = tuner.evaluate(setup_info, ring_map, np.array(GAINS), steps=1500, error_weight=0,
+                           max_error_rms=np.inf, backend='numpy')
+
+    assert np.all(costs == tuner.NO_LAP_TIME)
@@ -0,0 +1,30 @@
+import os
+import subprocess
+import sys
+
+import utils
+
+
+def test_lazy_module_imports_on_first_use():
+    calls = []
+
+    def importer():
+        calls.append(1)
+        return utils
+
+    module = utils.LazyModule(importer)
+    assert calls == []
+
+    assert module.rotate_vector is utils.rotate_vector
+    assert module.is_outside is utils.is_outside
+    assert calls == [1]
+
+
+def test_headless_modules_do_not_import_pygame():
+    code = ("import sys; sys.path.insert(0, 'scripts'); "
+            "import arena, classes, cli, kernel, server, simulation, tilemap, tuner; "
+            "print('pygame' in sys.modules)")
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(utils.__file__))))
+
+    assert output.stdout.strip() == 'False'